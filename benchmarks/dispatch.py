@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# This file is part of Handheld Game Console Controller System (HandyGCCS)
+# Copyright 2022-2023 Derek J. Clark <derekjohn.clark@gmail.com>
+#
+# Measures the per-frame cost of the keyboard dispatch path of each driver. "unfiltered"
+# formats the debug lines and runs the driver for every frame, which is what the capture
+# loop used to do. "filtered" drops uninteresting frames with chords.is_interesting and only
+# logs with DEBUG enabled, which is what it does now. The workload presses and releases
+# every chord of the driver with autorepeat and MSC_SCAN events in between, like a held
+# button on an AT keyboard.
+#
+# Usage: python benchmarks/dispatch.py [--repeats N] [--rounds N] [--system-type AYA_GEN1]
+
+import argparse
+import asyncio
+import importlib
+import json
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from evdev import InputEvent, ecodes as e
+from handycon import actions
+from handycon import chords
+from handycon import devices
+from handycon import registry
+from handycon import utilities
+from handycon.constants import EVENT_MAP
+
+logger = logging.getLogger("dispatch")
+
+
+# Just enough of HandheldController for the chord engine and the key handlers. Output is
+# dropped so only the dispatch work is measured.
+class Controller:
+    def __init__(self):
+        self.config = {}
+        self.event_queue = actions.Pending()
+        self.last_button = None
+        self.shutdown = False
+        self.logger = logger
+
+        # Use the default button map.
+        utilities.set_handycon(self)
+        utilities.set_default_config()
+        self.button_map = {button: EVENT_MAP[self.config["Button Map"][button]] for button in self.config["Button Map"] if button.startswith("button")}
+
+    def emit_event(self, event):
+        pass
+
+    async def emit_now(self, seed_event, event_list, value):
+        pass
+
+    async def do_rumble(self, button=0, interval=10, length=1000, delay=0):
+        pass
+
+    async def handle_key_down(self, seed_event, queued_event):
+        await devices.handle_key_down(seed_event, queued_event)
+
+    async def handle_key_up(self, seed_event, queued_event):
+        await devices.handle_key_up(seed_event, queued_event)
+
+
+# Builds (frame, active_keys) pairs for every chord in the table.
+def make_frames(table, repeats):
+    frames = []
+
+    def frame(events, active_keys):
+        events = [InputEvent(0, 0, e.EV_MSC, e.MSC_SCAN, 0x70000 + code) for code, value in events] + \
+                 [InputEvent(0, 0, e.EV_KEY, code, value) for code, value in events] + \
+                 [InputEvent(0, 0, e.EV_SYN, e.SYN_REPORT, 0)]
+        frames.append((events, sorted(active_keys)))
+
+    for chord in table.chords:
+        for keys in chord.press:
+            keys = sorted(keys)
+            frame([(code, 1) for code in keys], keys)
+            for repeat in range(repeats):
+                frame([(keys[-1], 2)], keys)
+            frame([(code, 0) for code in keys], [])
+            # The SYN_REPORT that follows a release, on its own.
+            frames.append(([InputEvent(0, 0, e.EV_SYN, e.SYN_REPORT, 0)], []))
+    return frames
+
+
+async def unfiltered(handheld, frames):
+    for frame, active_keys in frames:
+        for seed_event in frame:
+            logger.debug(f"Seed Value: {seed_event.value}, Seed Code: {seed_event.code}, Seed Type: {seed_event.type}.")
+        logger.debug(f"Active Keys: {active_keys}")
+        logger.debug(f"Queued events: {chords.handycon.event_queue}")
+        await handheld.process_frame(frame, active_keys)
+
+
+async def filtered(handheld, frames):
+    table = handheld.CHORDS
+    process_frame = handheld.process_frame
+    for frame, active_keys in frames:
+        if not chords.is_interesting(table, frame, active_keys):
+            continue
+        if logger.isEnabledFor(logging.DEBUG):
+            devices.log_frame(frame, active_keys)
+        await process_frame(frame, active_keys)
+
+
+async def measure(mode, handheld, frames, rounds):
+    best = None
+    for run in range(rounds):
+        start = time.perf_counter()
+        await mode(handheld, frames)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best / len(frames) * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the keyboard dispatch cost of each driver.")
+    parser.add_argument("--repeats", type=int, default=30, help="autorepeat frames per held chord")
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--system-type", action="append", help="driver to measure, default all")
+    args = parser.parse_args()
+
+    controller = Controller()
+    for module in (chords, devices):
+        module.set_handycon(controller)
+
+    results = {}
+    for system_type in args.system_type or sorted(registry.HANDHELD_DRIVERS):
+        handheld = importlib.import_module(f"handycon.handhelds.{registry.HANDHELD_DRIVERS[system_type]}")
+        frames = make_frames(handheld.CHORDS, args.repeats)
+        before = asyncio.run(measure(unfiltered, handheld, frames, args.rounds))
+        after = asyncio.run(measure(filtered, handheld, frames, args.rounds))
+        results[system_type] = {
+            "frames": len(frames),
+            "unfiltered_ns_per_frame": round(before),
+            "filtered_ns_per_frame": round(after),
+            "speedup": round(before / after, 2),
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+# This file is part of Handheld Game Console Controller System (HandyGCCS)
+# Copyright 2022-2023 Derek J. Clark <derekjohn.clark@gmail.com>
+#
+# Microbenchmarks the event handling of every handheld driver. Each driver runs against
+# the replay controller, so the real chord, action and scheduler code runs and output goes
+# to a memfd instead of uinput. The workload presses and releases every chord of the
+# driver with autorepeat in between, plus missed keys: chords pressed partially, releases
+# without a press and presses whose release never arrives. The Legion Go also gets HID
+# reports for its Legion buttons.
+#
+# Reported per driver: dispatches per second, p50/p99 cost of one dispatch (a frame, or a
+# HID report), the peak bytes allocated while handling one and the memory blocks still
+# held afterwards. Output is JSON so runs can be compared across commits. Each driver is
+# also checked to forward the autorepeat of its passthrough keys (volume up/down) and to
+# release a chord let go of in the same frame as another key, the run fails if one doesn't.
+#
+# Usage: python benchmarks/handhelds.py [--repeats N] [--rounds N] [--driver go_gen1] [--output FILE]
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from evdev import InputEvent, ecodes as e
+from handycon import registry
+from handycon import scheduler
+from handycon.replay import Keyboard, ReplayController
+
+# Legion button bits, see HidButtons in handhelds/go_gen1.py.
+LEGION_REPORTS = [(18, 128), (18, 64)]
+
+
+def key_frame(keys, value):
+    return [InputEvent(0, 0, e.EV_KEY, code, value) for code in keys] + [InputEvent(0, 0, e.EV_SYN, e.SYN_REPORT, 0)]
+
+
+def syn_frame():
+    return [InputEvent(0, 0, e.EV_SYN, e.SYN_REPORT, 0)]
+
+
+# Builds the workload of a driver as ("frame", events, active_keys) or ("hid", report, None).
+def make_workload(handheld, repeats):
+    workload = []
+    for chord in handheld.CHORDS.chords:
+        for keys in chord.press:
+            keys = sorted(keys)
+            workload.append(("frame", key_frame(keys, 1), keys))
+            for repeat in range(repeats):
+                workload.append(("frame", key_frame(keys[-1:], 2), keys))
+            workload.append(("frame", key_frame(keys, 0), []))
+            workload.append(("frame", syn_frame(), []))
+
+            # Missed keys: only part of the chord, a release without its press and a
+            # press whose release was lost.
+            if len(keys) > 1:
+                workload.append(("frame", key_frame(keys[:1], 1), keys[:1]))
+                workload.append(("frame", key_frame(keys[:1], 0), []))
+            workload.append(("frame", key_frame(keys[-1:], 0), []))
+            workload.append(("frame", key_frame(keys, 1), keys))
+            workload.append(("frame", syn_frame(), []))
+            workload.append(("frame", syn_frame(), []))
+
+    if handheld.__name__.endswith("go_gen1"):
+        for index, value in LEGION_REPORTS:
+            pressed = bytearray(64)
+            pressed[index] = value
+            workload.append(("hid", bytes(pressed), None))
+            workload.append(("hid", bytes(64), None))
+            workload.append(("hid", bytes(pressed), None))
+            workload.append(("hid", bytes(64), None))
+
+        # Both Legion buttons at once, then one let go.
+        both = bytearray(64)
+        both[18] = 128 | 64
+        only_right = bytearray(64)
+        only_right[18] = 64
+        workload.append(("hid", bytes(both), None))
+        workload.append(("hid", bytes(only_right), None))
+        workload.append(("hid", bytes(64), None))
+    return workload
+
+
+async def dispatch(handheld, kind, data, active_keys):
+    if kind == "hid":
+        await handheld.process_event(None, None, data)
+    else:
+        await handheld.process_frame(data, active_keys)
+
+
+# Drops queued output so it doesn't build up between dispatches. Nothing drains the
+# scheduler here and timed frames would otherwise pile up.
+def reset_output(controller):
+    scheduler.pending.clear()
+    scheduler.busy_until = 0.0
+
+
+def reset_state(controller):
+    controller.event_queue.clear()
+    controller.hid_event_queue.clear()
+    controller.last_button = None
+    controller.shutdown = False
+    reset_output(controller)
+    os.ftruncate(controller.ui_device.fd, 0)
+    os.lseek(controller.ui_device.fd, 0, os.SEEK_SET)
+
+
+# Holds a passthrough key, like volume up, through the keyboard capture path. Every
+# autorepeat must be forwarded. Returns None if the driver passes nothing through.
+async def check_passthrough_repeats(controller):
+    table = controller.handheld.CHORDS
+    if not table.passthrough:
+        return None
+    code = min(table.passthrough)
+    reset_state(controller)
+    keyboard = Keyboard("keyboard", table.codes)
+    for value in (1, 2, 2, 2, 0):
+        await keyboard.feed(key_frame([code], value))
+    await keyboard.close()
+    forwarded = [value for ev_type, ev_code, value in controller.ui_device.events() if ev_type == e.EV_KEY and ev_code == code]
+    return forwarded == [1, 2, 2, 2, 0]
+
+
+# Presses every chord, then another key of the table that doesn't make a chord with it,
+# and lets go of all of them in one frame, with the extra key first and last. No button
+# may be left queued or held afterwards. Returns the chords that were.
+async def check_release_frames(controller):
+    handheld = controller.handheld
+    table = handheld.CHORDS
+    stuck = []
+    for chord in table.chords:
+        for keys in chord.press:
+            keys = sorted(keys)
+            extras = [code for code in table.codes - set(keys) - table.passthrough
+                      if (1, frozenset(keys + [code])) not in table.press_index]
+            extra = max(extras, default=None)
+            if extra is None:
+                continue
+            for order in ([extra] + keys, keys + [extra]):
+                reset_state(controller)
+                await handheld.process_frame(key_frame(keys, 1), keys)
+                await handheld.process_frame(key_frame([extra], 1), sorted(keys + [extra]))
+                await handheld.process_frame(key_frame(order, 0), [])
+                await handheld.process_frame(syn_frame(), [])
+                if controller.event_queue or controller.last_button:
+                    stuck.append(f"{chord.button or chord.action} {order}")
+    reset_state(controller)
+    return stuck
+
+
+def percentile(values, percent):
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+async def measure(controller, workload, rounds):
+    handheld = controller.handheld
+    timings = []
+    # The first round warms up caches and the action frames and isn't counted.
+    for run in range(rounds + 1):
+        reset_state(controller)
+        for kind, data, active_keys in workload:
+            start = time.perf_counter_ns()
+            await dispatch(handheld, kind, data, active_keys)
+            if run:
+                timings.append(time.perf_counter_ns() - start)
+            reset_output(controller)
+
+    # Allocations are measured in separate rounds, tracemalloc slows everything down.
+    reset_state(controller)
+    peaks = []
+    tracemalloc.start()
+    for kind, data, active_keys in workload:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        await dispatch(handheld, kind, data, active_keys)
+        peaks.append(tracemalloc.get_traced_memory()[1] - before)
+        reset_output(controller)
+    tracemalloc.stop()
+
+    # Blocks still allocated after a whole round, which should be none.
+    reset_state(controller)
+    blocks = sys.getallocatedblocks()
+    for kind, data, active_keys in workload:
+        await dispatch(handheld, kind, data, active_keys)
+        reset_output(controller)
+    retained = sys.getallocatedblocks() - blocks
+
+    timings.sort()
+    return {
+        "dispatches": len(workload),
+        "events": sum(len(data) if kind == "frame" else 1 for kind, data, active_keys in workload),
+        "dispatches_per_sec": round(len(timings) / (sum(timings) / 1e9)),
+        "p50_ns": percentile(timings, 50),
+        "p99_ns": percentile(timings, 99),
+        "alloc_peak_bytes_per_dispatch": round(sum(peaks) / len(peaks)),
+        "retained_blocks_per_dispatch": round(retained / len(workload), 3),
+    }
+
+
+def get_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmark the event handling of every handheld driver.")
+    parser.add_argument("--repeats", type=int, default=10, help="autorepeat frames per held chord")
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--driver", action="append", help="driver module to measure, default all")
+    parser.add_argument("--output", help="also write the results to this file")
+    args = parser.parse_args()
+
+    # Drivers warn about the devices they can't find.
+    logging.getLogger("handycon.handycon").setLevel(logging.ERROR)
+
+    # One system type per driver module.
+    drivers = {}
+    for system_type, driver in sorted(registry.HANDHELD_DRIVERS.items()):
+        drivers.setdefault(driver, system_type)
+
+    results = {}
+    failed = []
+    stuck_buttons = []
+    for driver, system_type in sorted(drivers.items()):
+        if args.driver and driver not in args.driver:
+            continue
+        controller = ReplayController(system_type)
+        workload = make_workload(controller.handheld, args.repeats)
+        results[driver] = asyncio.run(measure(controller, workload, args.rounds))
+        results[driver]["passthrough_repeats"] = asyncio.run(check_passthrough_repeats(controller))
+        if results[driver]["passthrough_repeats"] is False:
+            failed.append(driver)
+        stuck = asyncio.run(check_release_frames(controller))
+        results[driver]["release_frames"] = not stuck
+        if stuck:
+            stuck_buttons.append(f"{driver} ({', '.join(stuck)})")
+
+    report = json.dumps({
+        "commit": get_commit(),
+        "python": platform.python_version(),
+        "repeats": args.repeats,
+        "rounds": args.rounds,
+        "drivers": results,
+    }, indent=2)
+    print(report)
+    if args.output:
+        with open(args.output, "w") as output:
+            output.write(report + "\n")
+    errors = []
+    if failed:
+        errors.append(f"Autorepeat of passthrough keys was dropped by: {', '.join(failed)}")
+    if stuck_buttons:
+        errors.append(f"Buttons left stuck by a release frame: {'; '.join(stuck_buttons)}")
+    if errors:
+        sys.exit("\n".join(errors))
+
+
+if __name__ == "__main__":
+    main()
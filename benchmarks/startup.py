@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# This file is part of Handheld Game Console Controller System (HandyGCCS)
+# Copyright 2022-2023 Derek J. Clark <derekjohn.clark@gmail.com>
+#
+# Measures the import time and peak RSS of the service modules. "lazy" is what the
+# service does now: import the core modules and the single matched driver. "eager" imports
+# every driver and the hidapi binding, which is what every startup used to pay for.
+#
+# Usage: python benchmarks/startup.py [--runs N] [--system-type GO_GEN1]
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+SRC_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+CHILD = """
+import importlib, json, resource, sys, time
+start = time.perf_counter()
+import handycon.handycon
+from handycon import registry
+error = None
+if sys.argv[1] == "lazy":
+    importlib.import_module("handycon.handhelds." + registry.HANDHELD_DRIVERS[sys.argv[2]])
+else:
+    for driver in registry.HANDHELD_DRIVERS.values():
+        importlib.import_module("handycon.handhelds." + driver)
+    try:
+        import handycon.legion_configurator
+    except ImportError as err:
+        error = str(err)
+elapsed = time.perf_counter() - start
+print(json.dumps({
+    "seconds": elapsed,
+    "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    "modules": len(sys.modules),
+    "error": error,
+}))
+"""
+
+def run_child(mode, system_type):
+    env = dict(os.environ, PYTHONPATH=SRC_PATH, PYTHONDONTWRITEBYTECODE="1")
+    output = subprocess.check_output([sys.executable, "-c", CHILD, mode, system_type], env=env)
+    return json.loads(output)
+
+
+def summarize(samples):
+    return {
+        "seconds_median": statistics.median(sample["seconds"] for sample in samples),
+        "seconds_min": min(sample["seconds"] for sample in samples),
+        "max_rss_kb_median": statistics.median(sample["max_rss_kb"] for sample in samples),
+        "modules": samples[-1]["modules"],
+        "error": samples[-1]["error"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the import time and RSS of the service.")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--system-type", default="AYA_GEN1")
+    args = parser.parse_args()
+
+    results = {"system_type": args.system_type, "runs": args.runs}
+    for mode in ("lazy", "eager"):
+        # Warm the bytecode and page caches so both modes are measured the same way.
+        run_child(mode, args.system_type)
+        results[mode] = summarize([run_child(mode, args.system_type) for run in range(args.runs)])
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# This file is part of Handheld Game Console Controller System (HandyGCCS)
+# Copyright 2022-2023 Derek J. Clark <derekjohn.clark@gmail.com>
+
+## Python Modules
+import struct
+
+# Local modules
+from .constants import *
+
+# struct input_event. uinput stamps events itself, so the time is left at zero.
+EVENT = struct.Struct("llHHi")
+SYN_REPORT = EVENT.pack(0, 0, e.EV_SYN, e.SYN_REPORT, 0)
+
+# id(event_list): Action. Each Action holds its event_list so the id can't be reused.
+cache = {}
+
+# Contents of an event list: its interned action id. Never cleared, so an action keeps its
+# id when the config is remapped, and the table is bounded by the number of distinct
+# actions.
+ids = {}
+
+
+# An EVENT_MAP entry compiled into the bytes written to the virtual device. Each key goes
+# out in its own SYN_REPORT frame so the scheduler can space them BUTTON_DELAY apart.
+# Releases are in reverse order. command is set instead for the string actions, like
+# "Open Chimera". id is the small integer the action is interned as, and instant and
+# queued cache its INSTANT_EVENTS and QUEUED_EVENTS membership. name is the EVENT_MAP key,
+# used to label latency.
+class Action:
+    def __init__(self, event_list):
+        self.event_list = event_list
+        key = tuple(event if type(event) == str else tuple(event) for event in event_list)
+        self.id = ids.setdefault(key, len(ids))
+        self.instant = event_list in INSTANT_EVENTS
+        self.queued = event_list in QUEUED_EVENTS
+        self.name = next((name for name, events in EVENT_MAP.items() if events == event_list), str(event_list))
+        self.command = None
+        self.press = []
+        self.release = []
+        if type(event_list[0]) == str:
+            self.command = event_list[0]
+            return
+        for ev_type, code in event_list:
+            self.press.append(EVENT.pack(0, 0, ev_type, code, 1) + SYN_REPORT)
+        for ev_type, code in reversed(event_list):
+            self.release.append(EVENT.pack(0, 0, ev_type, code, 0) + SYN_REPORT)
+
+
+# Rebuilds the cache for a button map. Called whenever the config is mapped.
+def compile_actions(button_map):
+    cache.clear()
+    for event_list in button_map.values():
+        get_action(event_list)
+
+
+# Returns the compiled action for an event list, compiling it the first time it is seen.
+def get_action(event_list):
+    action = cache.get(id(event_list))
+    if action is None:
+        action = Action(event_list)
+        cache[id(event_list)] = action
+    return action
+
+
+# Packs InputEvents into frames, one SYN_REPORT frame per event.
+def pack_events(events):
+    return [EVENT.pack(event.sec, event.usec, event.type, event.code, event.value) + SYN_REPORT for event in events]
+
+
+# Insertion ordered set of pending event lists, keyed by action id. Membership, add and
+# removal are O(1), an action can only be pending once, and first() is the oldest.
+class Pending:
+    def __init__(self):
+        self.items = {}
+
+    def __bool__(self):
+        return bool(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        return iter(self.items.values())
+
+    def __contains__(self, event_list):
+        return get_action(event_list).id in self.items
+
+    def __repr__(self):
+        return repr(list(self.items.values()))
+
+    def add(self, event_list):
+        self.items.setdefault(get_action(event_list).id, event_list)
+
+    def discard(self, event_list):
+        self.items.pop(get_action(event_list).id, None)
+
+    def first(self):
+        return next(iter(self.items.values()))
+
+    def clear(self):
+        self.items.clear()
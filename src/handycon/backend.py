@@ -0,0 +1,364 @@
+#!/usr/bin/env python3
+# This file is part of Handheld Game Console Controller System (HandyGCCS)
+# Copyright 2022-2023 Derek J. Clark <derekjohn.clark@gmail.com>
+#
+# Everything handycon does with /dev/input goes through the backend in current:
+# enumerating, opening, hiding and restoring devices, creating the uinput device and
+# reading DMI. The devices it returns follow the evdev API the rest of the service uses:
+#
+#   input devices: name, path, phys, fd, grab(), ungrab(), read(), active_keys(),
+#                  write(type, code, value), upload_effect(effect), erase_effect(id)
+#   uinput device: fd, write_event(event), write(type, code, value), syn(), read(),
+#                  begin_upload(id), end_upload(upload), begin_erase(id), end_erase(erase)
+#
+# and the backend itself: setup(), start(loop), list_devices(), open(path),
+# create_uinput(events, **kwargs), hide(path, event), restore(path, event), remove(event),
+# restore_hidden() and read_dmi().
+#
+# fd must be pollable and is read and written directly by the reactor, passthrough and
+# scheduler. EvdevBackend is the real thing. FakeBackend builds scripted devices on pipes
+# so the whole service runs without hardware or root: set HANDYGCCS_FAKE_DEVICES to a
+# JSON script like
+#
+#   {
+#     "dmi": {"product_name": "AIR Pro", "sys_vendor": "AYANEO"},
+#     "user": "gamer",
+#     "devices": [
+#       {"name": "Power Button", "phys": "LNXPWRBN/button/input0",
+#        "capabilities": [0, 1],
+#        "events": [[1.0, 1, 116, 1], [1.0, 0, 0, 0], [1.1, 1, 116, 0], [1.1, 0, 0, 0]]}
+#     ]
+#   }
+#
+# where every event is [seconds after start, type, code, value].
+#
+# Scripted devices are only read by the capture tasks handycon.py starts, and for now
+# that is just the power button. The keyboard, controller and force feedback tasks and
+# make_controller are commented out there, so a scripted keyboard or gamepad is listed
+# and can be opened but nothing reads its events. Keyboard chords are exercised with
+# replay.py instead.
+
+## Python Modules
+import asyncio
+import getpass
+import json
+import os
+import socket
+import struct
+import sys
+import time
+
+# Local modules
+from .constants import *
+from . import registry
+
+## Partial imports
+from evdev import DeviceInfo, InputDevice, InputEvent, UInput
+from pathlib import Path
+from shutil import move
+from types import SimpleNamespace
+
+handycon = None
+
+INPUT_PATH = Path("/dev/input")
+SYS_INPUT_PATH = Path("/sys/class/input")
+
+# struct input_event
+EVENT = struct.Struct("llHHi")
+
+# The backend in use. Chosen by select() at startup.
+current = None
+
+def set_handycon(handheld_controller):
+    global handycon
+    handycon = handheld_controller
+
+
+# Picks the fake backend if HANDYGCCS_FAKE_DEVICES is set, the evdev backend otherwise.
+def select():
+    global current
+
+    script = os.environ.get(FAKE_DEVICES_ENV)
+    if script:
+        handycon.logger.info(f"Using fake input devices from {script}.")
+        with open(script, "r") as script_file:
+            current = FakeBackend(json.load(script_file))
+    else:
+        current = EvdevBackend()
+    return current
+
+
+class EvdevBackend:
+    # Nothing to prepare on real hardware.
+    def setup(self):
+        pass
+
+    def start(self, loop):
+        pass
+
+    # Yields (path, name, phys, capabilities, info) for every event node. Read from sysfs so
+    # no node is opened (or USB device woken) to identify it.
+    def list_devices(self):
+        for sys_path in SYS_INPUT_PATH.glob("event*"):
+            path = str(INPUT_PATH / sys_path.name)
+
+            # Skip nodes we have already hidden.
+            if not os.path.exists(path):
+                continue
+            try:
+                device_path = sys_path / "device"
+                name = read_attribute(device_path / "name")
+                phys = read_attribute(device_path / "phys")
+                info = DeviceInfo(
+                        int(read_attribute(device_path / "id/bustype"), 16),
+                        int(read_attribute(device_path / "id/vendor"), 16),
+                        int(read_attribute(device_path / "id/product"), 16),
+                        int(read_attribute(device_path / "id/version"), 16),
+                        )
+                capabilities = parse_bitmask(read_attribute(device_path / "capabilities/ev"))
+            except (OSError, ValueError):
+                # The device went away while we were reading it.
+                continue
+            yield path, name, phys, capabilities, info
+
+    def open(self, path):
+        return InputDevice(path)
+
+    def create_uinput(self, events, **kwargs):
+        return UInput(events, **kwargs)
+
+    # Moves a grabbed node out of /dev/input so nothing else opens it.
+    def hide(self, path, event):
+        move(path, str(HIDE_PATH / event))
+
+    def restore(self, path, event):
+        move(str(HIDE_PATH / event), path)
+
+    # Deletes the hidden node of a device that is gone.
+    def remove(self, event):
+        os.remove(str(HIDE_PATH / event))
+
+    # Puts back anything a previous run left hidden.
+    def restore_hidden(self):
+        Path(HIDE_PATH).mkdir(parents=True, exist_ok=True)
+        for hidden_event in os.listdir(HIDE_PATH):
+            handycon.logger.debug(f'Restoring {hidden_event}')
+            move(str(HIDE_PATH / hidden_event), str(INPUT_PATH / hidden_event))
+
+    def read_dmi(self):
+        return registry.read_dmi()
+
+
+def read_attribute(path):
+    with open(path, "r") as attribute:
+        return attribute.read().rstrip('\n')
+
+
+# Converts a sysfs capability bitmask ("120013", or space separated longs with the most
+# significant first) into the list of set bit numbers.
+def parse_bitmask(value):
+    bits = []
+    word_size = 64 if sys.maxsize > 2**32 else 32
+    for word_index, word in enumerate(reversed(value.split())):
+        word = int(word, 16)
+        bit = 0
+        while word:
+            if word & 1:
+                bits.append(word_index * word_size + bit)
+            word >>= 1
+            bit += 1
+    return bits
+
+
+# Reads every complete struct input_event waiting on fd. Raises BlockingIOError if there
+# are none, like evdev does.
+def read_fd_events(fd):
+    data = os.read(fd, EVENT.size * 64)
+    return [InputEvent(*event) for event in EVENT.iter_unpack(data[:len(data) - len(data) % EVENT.size])]
+
+
+# A scripted input device. Injected events are written to a pipe as struct input_event,
+# so the reactor and passthrough read it like a real node.
+class FakeDevice:
+    def __init__(self, path, name, phys, capabilities, info):
+        self.path = path
+        self.name = name
+        self.phys = phys
+        self.capabilities = capabilities
+        self.info = info
+        self.fd, self.write_fd = os.pipe()
+        os.set_blocking(self.fd, False)
+        self.keys = set()
+        self.grabbed = False
+        self.written = []     # (type, code, value) written back to the device, like FF.
+        self.effects = {}
+
+    def inject(self, events):
+        sec, usec = divmod(time.clock_gettime_ns(time.CLOCK_MONOTONIC) // 1000, 1000000)
+        for ev_type, code, value in events:
+            if ev_type == e.EV_KEY and value == 1:
+                self.keys.add(code)
+            elif ev_type == e.EV_KEY and value == 0:
+                self.keys.discard(code)
+        os.write(self.write_fd, b"".join(EVENT.pack(sec, usec, *event) for event in events))
+
+    def grab(self):
+        self.grabbed = True
+
+    def ungrab(self):
+        self.grabbed = False
+
+    def read(self):
+        return read_fd_events(self.fd)
+
+    def active_keys(self):
+        return sorted(self.keys)
+
+    def write(self, ev_type, code, value):
+        self.written.append((ev_type, code, value))
+
+    def upload_effect(self, effect):
+        effect_id = len(self.effects)
+        self.effects[effect_id] = effect
+        return effect_id
+
+    def erase_effect(self, effect_id):
+        self.effects.pop(effect_id, None)
+
+    def close(self):
+        os.close(self.fd)
+        os.close(self.write_fd)
+
+
+# The virtual device. Output goes through a socketpair and is collected in output, FF
+# requests can be injected from the other side.
+class FakeUInput:
+    def __init__(self, name):
+        self.name = name
+        self.fd, self.peer = socket_pair()
+        self.output = []      # (type, code, value) of everything written.
+        self.pending = b""
+        self.uploads = {}
+        self.erases = {}
+        asyncio.get_event_loop().add_reader(self.peer, self.drain)
+
+    def drain(self):
+        try:
+            self.pending += os.read(self.peer, EVENT.size * 256)
+        except BlockingIOError:
+            return
+        end = len(self.pending) - len(self.pending) % EVENT.size
+        self.output.extend(event[2:] for event in EVENT.iter_unpack(self.pending[:end]))
+        self.pending = self.pending[end:]
+
+    def write(self, ev_type, code, value):
+        os.write(self.fd, EVENT.pack(0, 0, ev_type, code, value))
+
+    def write_event(self, event):
+        self.write(event.type, event.code, event.value)
+
+    def syn(self):
+        self.write(e.EV_SYN, e.SYN_REPORT, 0)
+
+    def read(self):
+        return read_fd_events(self.fd)
+
+    # FF requests, as the kernel would hand them to us after an EV_UINPUT event.
+    def inject_upload(self, request_id, effect):
+        self.uploads[request_id] = SimpleNamespace(request_id=request_id, effect=effect, retval=0)
+        os.write(self.peer, EVENT.pack(0, 0, e.EV_UINPUT, e.UI_FF_UPLOAD, request_id))
+
+    def inject_erase(self, request_id, effect_id):
+        self.erases[request_id] = SimpleNamespace(request_id=request_id, effect_id=effect_id, retval=0)
+        os.write(self.peer, EVENT.pack(0, 0, e.EV_UINPUT, e.UI_FF_ERASE, request_id))
+
+    def begin_upload(self, request_id):
+        return self.uploads[request_id]
+
+    def end_upload(self, upload):
+        self.uploads.pop(upload.request_id, None)
+
+    def begin_erase(self, request_id):
+        return self.erases[request_id]
+
+    def end_erase(self, erase):
+        self.erases.pop(erase.request_id, None)
+
+    def close(self):
+        asyncio.get_event_loop().remove_reader(self.peer)
+        os.close(self.fd)
+        os.close(self.peer)
+
+
+def socket_pair():
+    ours, peer = socket.socketpair()
+    ours.setblocking(False)
+    peer.setblocking(False)
+    return ours.detach(), peer.detach()
+
+
+class FakeBackend:
+    def __init__(self, script):
+        self.script = script
+        self.devices = {}
+        self.hidden = set()
+        self.ui_device = None
+        for index, spec in enumerate(script.get("devices", [])):
+            path = f"/dev/input/event{index}"
+            info = DeviceInfo(*spec.get("id", [0, 0, 0, 0]))
+            self.devices[path] = FakeDevice(path, spec["name"], spec.get("phys", ""), spec.get("capabilities", [e.EV_SYN, e.EV_KEY]), info)
+
+    # Stands in for the session lookups that need a logged in user. Power and performance
+    # commands are skipped, a scripted power button shouldn't suspend the box running it.
+    def setup(self):
+        handycon.USER = self.script.get("user", getpass.getuser())
+        handycon.dry_run = True
+
+    # Plays the scripted events once the loop runs.
+    def start(self, loop):
+        for spec, device in zip(self.script.get("devices", []), self.devices.values()):
+            frames = {}
+            for delay, ev_type, code, value in spec.get("events", []):
+                frames.setdefault(delay, []).append((ev_type, code, value))
+            for delay, events in frames.items():
+                loop.call_later(delay, device.inject, events)
+
+    def list_devices(self):
+        for path, device in self.devices.items():
+            if path not in self.hidden:
+                yield path, device.name, device.phys, device.capabilities, device.info
+
+    def open(self, path):
+        device = self.devices.get(path)
+        if not device:
+            raise FileNotFoundError(path)
+        return device
+
+    def create_uinput(self, events, **kwargs):
+        self.ui_device = FakeUInput(kwargs.get("name", "Fake UInput"))
+        return self.ui_device
+
+    def hide(self, path, event):
+        self.hidden.add(path)
+
+    def restore(self, path, event):
+        if path not in self.hidden:
+            raise FileNotFoundError(path)
+        self.hidden.discard(path)
+
+    # The device is unplugged, it won't be listed again.
+    def remove(self, event):
+        for path in self.hidden:
+            if Path(path).name == event:
+                self.hidden.discard(path)
+                self.devices.pop(path).close()
+                return
+        raise FileNotFoundError(event)
+
+    def restore_hidden(self):
+        self.hidden.clear()
+
+    def read_dmi(self):
+        dmi = {key: "" for key in registry.DMI_KEYS}
+        dmi.update(self.script.get("dmi", {}))
+        return dmi
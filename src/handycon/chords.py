@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# This file is part of Handheld Game Console Controller System (HandyGCCS)
+# Copyright 2022-2023 Derek J. Clark <derekjohn.clark@gmail.com>
+
+# Local modules
+from .constants import *
+from . import frames
+
+handycon = None
+
+def set_handycon(handheld_controller):
+    global handycon
+    handycon = handheld_controller
+
+
+# A button on the handheld, described by the keys its firmware holds down.
+#   button: button_map key the chord fires, e.g. "button2".
+#   press: list of active key combinations that press the button.
+#   release: keycodes whose KEY_UP releases the button once no keys are held.
+#   action: EVENT_MAP name to fire instead of a configurable button, e.g. "VOLUP".
+#   value: seed event value that presses the button. 2 matches a long press (autorepeat).
+#   code: only press when the seed event has this keycode.
+#   cancels: buttons taken out of the event queue when this one is pressed.
+#   rumble: do_rumble arguments played when the button is pressed.
+#   rumble_release: do_rumble arguments played when the button is released.
+#   ignore_shutdown: don't press while a power button shutdown is in progress.
+class Chord:
+    def __init__(self, button=None, press=(), release=(), action=None, value=1, code=None,
+                 cancels=(), rumble=None, rumble_release=None, ignore_shutdown=False):
+        self.button = button
+        self.press = press
+        self.release = release
+        self.action = action
+        self.value = value
+        self.code = code
+        self.cancels = cancels
+        self.rumble = rumble
+        self.rumble_release = rumble_release
+        self.ignore_shutdown = ignore_shutdown
+
+    def __repr__(self):
+        return f"Chord({self.button or self.action}, press={self.press}, release={self.release})"
+
+
+# A driver's chords compiled into hash lookups.
+#   passthrough: keycodes forwarded to the virtual controller untouched.
+#   fire_on_release: queue buttons on press and fire them on release. Otherwise buttons are
+#       handed to handle_key_down/handle_key_up as they happen.
+#   reset_shutdown: a lone KEY_LEFTMETA release ends a power button shutdown.
+class ChordTable:
+    def __init__(self, chords, passthrough=(), fire_on_release=False, reset_shutdown=False):
+        self.chords = chords
+        self.passthrough = frozenset(passthrough)
+        self.fire_on_release = fire_on_release
+        self.reset_shutdown = reset_shutdown
+
+        # (value, frozenset(active_keys)): chord
+        self.press_index = {}
+
+        # keycode: [chord, ...] in table order
+        self.release_index = {}
+
+        # Every keycode the table reads. Used to filter the keyboards in the kernel.
+        codes = set(self.passthrough)
+        if reset_shutdown:
+            codes.add(e.KEY_LEFTMETA)
+
+        for chord in chords:
+            for keys in chord.press:
+                key = (chord.value, frozenset(keys))
+                if key in self.press_index:
+                    raise ValueError(f"{chord} and {self.press_index[key]} are both pressed by {keys}")
+                self.press_index[key] = chord
+                codes.update(keys)
+            for code in chord.release:
+                self.release_index.setdefault(code, []).append(chord)
+            codes.update(chord.release)
+            if chord.code is not None:
+                codes.add(chord.code)
+        self.codes = frozenset(codes)
+
+        # Autorepeat only matters if a chord is pressed by one.
+        self.repeats = any(chord.value == 2 for chord in chords)
+
+
+# Returns the event list a chord fires with the current config.
+def get_button(chord):
+    if chord.action:
+        return EVENT_MAP[chord.action]
+    return handycon.button_map[chord.button]
+
+
+# Returns True if a frame can change anything: a press or release of a key the table
+# reads, an autorepeat the table uses or forwards, or any frame while a button is waiting
+# to be released. Everything else (other repeats, lone SYN_REPORTs, MSC_SCAN) is dropped
+# before logging or driver code runs.
+def is_interesting(table, frame, active_keys):
+    if handycon.last_button or (handycon.event_queue and not active_keys):
+        return True
+    for event in frame:
+        if event.type == e.EV_KEY and event.code in table.codes and \
+                (event.value != 2 or table.repeats or event.code in table.passthrough):
+            return True
+    return False
+
+
+# Translates a SYN_REPORT frame of keyboard events into button presses using the driver's
+# chord table. Chords are matched once against the keys held after the whole frame, and
+# every key released in it is checked against the release index. The SYN_REPORT is then
+# run through on its own, which is what releases queued buttons.
+async def process_frame(table, frame, active_keys):
+    # Automatically pass default keycodes we dont intend to replace.
+    released = []
+    for event in frame:
+        if event.type == e.EV_KEY:
+            if event.code in table.passthrough:
+                handycon.emit_event(event)
+            if event.value == 0:
+                released.append(event.code)
+
+    seed_event = frames.get_seed(frame, active_keys)
+    if seed_event:
+        await process_event(table, seed_event, active_keys, released)
+    await process_event(table, frame[-1], active_keys)
+
+
+# Translates a single keyboard event into button presses using the driver's chord table.
+# released is every keycode let go in the same frame, just the seed's if not given.
+async def process_event(table, seed_event, active_keys, released=None):
+    button_on = seed_event.value
+    this_button = None
+
+    # Handle missed keys.
+    if table.fire_on_release and not active_keys and handycon.event_queue:
+        this_button = handycon.event_queue.first()
+
+    if active_keys:
+        chord = table.press_index.get((button_on, frozenset(active_keys)))
+        if chord and (chord.code is None or chord.code == seed_event.code) \
+                and not (chord.ignore_shutdown and handycon.shutdown):
+            button = get_button(chord)
+            if button not in handycon.event_queue:
+                for cancel in chord.cancels:
+                    cancelled = handycon.button_map[cancel]
+                    handycon.event_queue.discard(cancelled)
+                if table.fire_on_release:
+                    handycon.event_queue.add(button)
+                else:
+                    await handycon.handle_key_down(seed_event, button)
+                if chord.rumble:
+                    await handycon.do_rumble(*chord.rumble)
+
+    elif button_on == 0:
+        if released is None:
+            released = (seed_event.code,)
+        seen = set()
+        for code in released:
+            for chord in table.release_index.get(code, ()):
+                if chord in seen:
+                    continue
+                seen.add(chord)
+                button = get_button(chord)
+                if button not in handycon.event_queue:
+                    continue
+                if table.fire_on_release:
+                    this_button = button
+                else:
+                    await handycon.handle_key_up(seed_event, button)
+                if chord.rumble_release:
+                    await handycon.do_rumble(*chord.rumble_release)
+
+        # Handle L_META from power button
+        if table.reset_shutdown and e.KEY_LEFTMETA in released and not handycon.event_queue and handycon.shutdown:
+            handycon.shutdown = False
+
+    if not table.fire_on_release:
+        if handycon.last_button:
+            await handycon.handle_key_up(seed_event, handycon.last_button)
+        return
+
+    # Create list of events to fire.
+    # Handle new button presses.
+    if this_button and not handycon.last_button:
+        handycon.event_queue.discard(this_button)
+        handycon.last_button = this_button
+        await handycon.emit_now(seed_event, this_button, 1)
+
+    # Clean up old button presses.
+    elif handycon.last_button and not this_button:
+        await handycon.emit_now(seed_event, handycon.last_button, 0)
+        handycon.last_button = None
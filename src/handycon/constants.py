@@ -194,6 +194,9 @@ CONTROLLER_EVENTS = {
     ],
 }
 DETECT_DELAY = 0.5
+HID_REPORT_SIZE = 64
+DEVICE_PROFILE_DIR = "/etc/handygccs/devices.d/"
+DMI_PATH = Path("/sys/devices/virtual/dmi/id")
 EVENT_ALT_TAB = [[e.EV_KEY, e.KEY_LEFTALT], [e.EV_KEY, e.KEY_TAB]]
 EVENT_ESC = [[e.EV_MSC, e.MSC_SCAN], [e.EV_KEY, e.KEY_ESC]]
 EVENT_KILL = [[e.EV_KEY, e.KEY_LEFTMETA], [e.EV_KEY, e.KEY_LEFTCTRL], [e.EV_KEY, e.KEY_ESC]]
@@ -243,3 +246,8 @@ HIDE_PATH = Path("/dev/input/.hidden/")
 HOME_PATH = Path('/home')
 JOY_MAX = 32767
 JOY_MIN = -32767
+METRICS_PATH = Path("/run/handygccs/metrics.sock")
+RECORD_ENV = "HANDYGCCS_RECORD"
+FAKE_DEVICES_ENV = "HANDYGCCS_FAKE_DEVICES"
+LEGION_PROFILE_CACHE = Path("/var/lib/handygccs/legion_profile.json")
+LEGION_KNOWN_GOOD = Path("/var/lib/handygccs/legion_known_good.json")
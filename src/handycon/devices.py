@@ -4,45 +4,33 @@
 
 ## Python Modules
 import asyncio
+import logging
 import os
 import traceback
 
 # Local modules
-import handycon.handhelds.ally_gen1 as ally_gen1
-import handycon.handhelds.anb_gen1 as anb_gen1
-import handycon.handhelds.aok_gen1 as aok_gen1
-import handycon.handhelds.aok_gen2 as aok_gen2
-import handycon.handhelds.aya_gen1 as aya_gen1
-import handycon.handhelds.aya_gen2 as aya_gen2
-import handycon.handhelds.aya_gen3 as aya_gen3
-import handycon.handhelds.aya_gen4 as aya_gen4
-import handycon.handhelds.aya_gen5 as aya_gen5
-import handycon.handhelds.aya_gen6 as aya_gen6
-import handycon.handhelds.aya_gen7 as aya_gen7
-import handycon.handhelds.ayn_gen1 as ayn_gen1
-import handycon.handhelds.ayn_gen2 as ayn_gen2
-import handycon.handhelds.ayn_gen3 as ayn_gen3
-import handycon.handhelds.go_gen1 as go_gen1
-import handycon.handhelds.gpd_gen1 as gpd_gen1
-import handycon.handhelds.gpd_gen2 as gpd_gen2
-import handycon.handhelds.gpd_gen3 as gpd_gen3
-import handycon.handhelds.oxp_gen1 as oxp_gen1
-import handycon.handhelds.oxp_gen2 as oxp_gen2
-import handycon.handhelds.oxp_gen3 as oxp_gen3
-import handycon.handhelds.oxp_gen4 as oxp_gen4
-import handycon.handhelds.oxp_gen5 as oxp_gen5
-import handycon.handhelds.oxp_gen6 as oxp_gen6
-import handycon.handhelds.oxp_gen7 as oxp_gen7
 from .constants import *
-from . import legion_configurator as lc
+from . import actions
+from . import backend
+from . import chords
+from . import evmask
+from . import frames
+from . import hotplug
+from . import inventory
+from . import keystate
+from . import latency
+from . import metrics
+from . import passthrough
+from . import reactor
+from . import recording
+from . import scheduler
 
 ## Partial imports
-from evdev import ecodes as e, ff, InputDevice, InputEvent, list_devices, UInput
+from evdev import ecodes as e, ff, InputEvent
 from pathlib import Path
-from shutil import move
-from time import sleep
 
 handycon = None
+ff_effect_id_set = set()
 hid_qam = False
 hid_mode = False
 
@@ -57,29 +45,24 @@ def get_controller():
     # Identify system input event devices.
     handycon.logger.debug(f"Attempting to grab {handycon.GAMEPAD_NAME}.")
     try:
-        devices_original = [InputDevice(path) for path in list_devices()]
-
+        handycon.controller_device = inventory.open_device(handycon.GAMEPAD_NAME, handycon.GAMEPAD_ADDRESS)
     except Exception as err:
         handycon.logger.error("Error when scanning event devices. Restarting scan.")
         handycon.logger.error(traceback.format_exc())
-        sleep(DETECT_DELAY)
         return False
 
     # Grab the built-in devices. This will give us exclusive acces to the devices and their capabilities.
-    for device in devices_original:
-        if device.name == handycon.GAMEPAD_NAME and device.phys == handycon.GAMEPAD_ADDRESS:
-            handycon.controller_path = device.path
-            handycon.controller_device = InputDevice(handycon.controller_path)
-            if handycon.CAPTURE_CONTROLLER:
-                handycon.controller_device.grab()
-                handycon.controller_event = Path(handycon.controller_path).name
-                move(handycon.controller_path, str(HIDE_PATH / handycon.controller_event))
-            break
+    if handycon.controller_device:
+        handycon.controller_path = handycon.controller_device.path
+        latency.set_clock(handycon.controller_device)
+        if handycon.CAPTURE_CONTROLLER:
+            handycon.controller_device.grab()
+            handycon.controller_event = Path(handycon.controller_path).name
+            backend.current.hide(handycon.controller_path, handycon.controller_event)
 
     # Sometimes the service loads before all input devices have full initialized. Try a few times.
     if not handycon.controller_device:
-        handycon.logger.warn("Controller device not yet found. Restarting scan.")
-        sleep(DETECT_DELAY)
+        handycon.logger.warn("Controller device not yet found. Waiting for it to appear.")
         return False
     else:
         handycon.logger.info(f"Found {handycon.controller_device.name}. Capturing input data.")
@@ -92,28 +75,24 @@ def get_keyboard():
     # Identify system input event devices.
     handycon.logger.debug(f"Attempting to grab {handycon.KEYBOARD_NAME}.")
     try:
-        devices_original = [InputDevice(path) for path in list_devices()]
+        handycon.keyboard_device = inventory.open_device(handycon.KEYBOARD_NAME, handycon.KEYBOARD_ADDRESS, e.EV_KEY)
     except Exception as err:
         handycon.logger.error("Error when scanning event devices. Restarting scan.")
         handycon.logger.error(traceback.format_exc())
-        sleep(DETECT_DELAY)
         return False
+
     # Grab the built-in devices. This will give us exclusive acces to the devices and their capabilities.
-    for device in devices_original:
-        handycon.logger.debug(f"{device.name}, {device.phys}")
-        if device.name == handycon.KEYBOARD_NAME and device.phys == handycon.KEYBOARD_ADDRESS:
-            handycon.keyboard_path = device.path
-            handycon.keyboard_device = InputDevice(handycon.keyboard_path)
-            if handycon.CAPTURE_KEYBOARD:
-                handycon.keyboard_device.grab()
-                handycon.keyboard_event = Path(handycon.keyboard_path).name
-                move(handycon.keyboard_path, str(HIDE_PATH / handycon.keyboard_event))
-            break
+    if handycon.keyboard_device:
+        handycon.keyboard_path = handycon.keyboard_device.path
+        latency.set_clock(handycon.keyboard_device)
+        if handycon.CAPTURE_KEYBOARD:
+            handycon.keyboard_device.grab()
+            handycon.keyboard_event = Path(handycon.keyboard_path).name
+            backend.current.hide(handycon.keyboard_path, handycon.keyboard_event)
 
     # Sometimes the service loads before all input devices have full initialized. Try a few times.
     if not handycon.keyboard_device:
-        handycon.logger.warn("Keyboard device not yet found. Restarting scan.")
-        sleep(DETECT_DELAY)
+        handycon.logger.warn("Keyboard device not yet found. Waiting for it to appear.")
         return False
     else:
         handycon.logger.info(f"Found {handycon.keyboard_device.name}. Capturing input data.")
@@ -125,29 +104,24 @@ def get_keyboard_2():
 
     handycon.logger.debug(f"Attempting to grab {handycon.KEYBOARD_2_NAME}.")
     try:
-        devices_original = [InputDevice(path) for path in list_devices()]
+        handycon.keyboard_2_device = inventory.open_device(handycon.KEYBOARD_2_NAME, handycon.KEYBOARD_2_ADDRESS, e.EV_KEY)
     except Exception as err:
         handycon.logger.error("Error when scanning event devices. Restarting scan.")
         handycon.logger.error(traceback.format_exc())
-        sleep(DETECT_DELAY)
         return False
 
     # Grab the built-in devices. This will give us exclusive acces to the devices and their capabilities.
-    for device in devices_original:
-        handycon.logger.debug(f"{device.name}, {device.phys}")
-        if device.name == handycon.KEYBOARD_2_NAME and device.phys == handycon.KEYBOARD_2_ADDRESS:
-            handycon.keyboard_2_path = device.path
-            handycon.keyboard_2_device = InputDevice(handycon.keyboard_2_path)
-            if handycon.CAPTURE_KEYBOARD:
-                handycon.keyboard_2_device.grab()
-                handycon.keyboard_2_event = Path(handycon.keyboard_2_path).name
-                move(handycon.keyboard_2_path, str(HIDE_PATH / handycon.keyboard_2_event))
-            break
+    if handycon.keyboard_2_device:
+        handycon.keyboard_2_path = handycon.keyboard_2_device.path
+        latency.set_clock(handycon.keyboard_2_device)
+        if handycon.CAPTURE_KEYBOARD:
+            handycon.keyboard_2_device.grab()
+            handycon.keyboard_2_event = Path(handycon.keyboard_2_path).name
+            backend.current.hide(handycon.keyboard_2_path, handycon.keyboard_2_event)
 
     # Sometimes the service loads before all input devices have full initialized. Try a few times.
     if not handycon.keyboard_2_device:
-        handycon.logger.warn("Keyboard device 2 not yet found. Restarting scan.")
-        sleep(DETECT_DELAY)
+        handycon.logger.warn("Keyboard device 2 not yet found. Waiting for it to appear.")
         return False
     else:
         handycon.logger.info(f"Found {handycon.keyboard_2_device.name}. Capturing input data.")
@@ -160,35 +134,31 @@ def get_powerkey():
     handycon.logger.debug(f"Attempting to grab power buttons.")
     # Identify system input event devices.
     try:
-        devices_original = [InputDevice(path) for path in list_devices()]
+        # Power Button
+        if not handycon.power_device:
+            handycon.power_device = inventory.open_device('Power Button', handycon.POWER_BUTTON_PRIMARY, e.EV_KEY)
+            if handycon.power_device:
+                handycon.logger.debug(f"found power device {handycon.power_device.phys}")
+                if handycon.CAPTURE_POWER:
+                    handycon.power_device.grab()
+
+        # Some devices have an extra power input device corresponding to the same
+        # physical button that needs to be grabbed.
+        if not handycon.power_device_2:
+            handycon.power_device_2 = inventory.open_device('Power Button', handycon.POWER_BUTTON_SECONDARY, e.EV_KEY)
+            if handycon.power_device_2:
+                handycon.logger.debug(f"found alternate power device {handycon.power_device_2.phys}")
+                if handycon.CAPTURE_POWER:
+                    handycon.power_device_2.grab()
+
     # Some funky stuff happens sometimes when booting. Give it another shot.
     except Exception as err:
         handycon.logger.error("Error when scanning event devices. Restarting scan.")
         handycon.logger.error(traceback.format_exc())
-        sleep(DETECT_DELAY)
         return False
 
-    # Grab the built-in devices. This will give us exclusive acces to the devices and their capabilities.
-    for device in devices_original:
-
-        # Power Button
-        if device.name == 'Power Button' and device.phys == handycon.POWER_BUTTON_PRIMARY and not handycon.power_device:
-            handycon.power_device = device
-            handycon.logger.debug(f"found power device {handycon.power_device.phys}")
-            if handycon.CAPTURE_POWER:
-                handycon.power_device.grab()
-
-        # Some devices have an extra power input device corresponding to the same
-        # physical button that needs to be grabbed.
-        if device.name == 'Power Button' and device.phys == handycon.POWER_BUTTON_SECONDARY and not handycon.power_device_2:
-            handycon.power_device_2 = device
-            handycon.logger.debug(f"found alternate power device {handycon.power_device_2.phys}")
-            if handycon.CAPTURE_POWER:
-                handycon.power_device_2.grab()
-
     if not handycon.power_device and not handycon.power_device_2:
-        handycon.logger.warn("No Power Button found. Restarting scan.")
-        sleep(DETECT_DELAY)
+        handycon.logger.warn("No Power Button found. Waiting for it to appear.")
         return False
     else:
         if handycon.power_device:
@@ -223,33 +193,114 @@ async def do_rumble(button=0, interval=10, length=1000, delay=0):
     handycon.controller_device.erase_effect(effect_id)
 
 
-# def get_lgo_hid_device():
-#     global handycon
+# Opens the Legion Go vendor HID interface as a non-blocking hidraw fd. This is the only
+# place it is enumerated, so only on startup and after it went away.
+# Brings the Legion Go controllers in line with the [Legion Profile] config. config is
+# what legion_configurator.get_config returned, looked up if not given.
+def apply_legion_profile(config=None):
+    global handycon
 
-#     handycon.logger.info(f"Attempting to grab hid device.")
-#     config = lc.get_config()
-#     handycon.legion_go_hid = config["path"]
-#     # handycon.legion_go_hid.nonblocking = 1
+    # Only needed once we know we are on a Legion Go.
+    from . import legion_configurator as lc
+    from . import legion_profile
 
-#     if(config):
-#         handycon.logger.info(f"hid device found")
-#     else:
-#         handycon.logger.info(f"uhoh, hid device not found")
+    if config is None:
+        config = lc.get_config()
+    if not config:
+        handycon.logger.warn("No Legion Go HID device found. Unable to apply the Legion profile.")
+        return
+    legion_profile.set_handycon(handycon)
+    asyncio.ensure_future(legion_profile.apply(config))
+
+
+def get_lgo_hid_device():
+    global handycon
 
+    from . import legion_configurator as lc
+
+    config = lc.get_config()
+    if not config:
+        handycon.logger.warn("No Legion Go HID device found. Waiting for it to appear.")
+        return False
+
+    path = config["path"]
+    if isinstance(path, bytes):
+        path = path.decode()
+    try:
+        handycon.legion_go_hid = os.open(path, os.O_RDONLY | os.O_NONBLOCK | os.O_CLOEXEC)
+    except OSError as err:
+        handycon.logger.error(f"{err} | Unable to open {path}.")
+        handycon.logger.error(traceback.format_exc())
+        return False
+    handycon.logger.info(f"Found Legion Go HID device {path}. Capturing input data.")
+
+    # Bring the controllers in line with the config on every attach.
+    apply_legion_profile(config)
+    return True
+
+
+# Reads the Legion Go HID reports at report rate while the device is there.
 async def capture_lgo_hid_device():
     global handycon
-    delay_value = 0.15
 
     while handycon.running:
-        # must fetch config on every iteration because
-        # it can change if controllers are detached
-        config = lc.get_config()
-        device = lc.Device(path=config["path"])
-        data = device.read(64)
-        if(len(data) != 0):
-            await go_gen1.process_event(None, None, data)
+        if handycon.legion_go_hid is not None:
+            try:
+                last_report = None
+                async for reports in reactor.read_report_batches(handycon.legion_go_hid, "hid", HID_REPORT_SIZE):
+                    for report in reports:
+                        if recording.recorder:
+                            recording.recorder.write("hid", recording.HID, report)
+                        # Nothing changed since the last report.
+                        if report == last_report:
+                            continue
+                        last_report = report
+                        await handycon.handheld.process_event(None, None, report)
+
+            except Exception as err:
+                handycon.logger.error(f"{err} | Error reading events from Legion Go HID device.")
+                handycon.logger.error(traceback.format_exc())
+            os.close(handycon.legion_go_hid)
+            handycon.legion_go_hid = None
+            await handycon.handheld.reset_hid_buttons()
+        else:
+            handycon.logger.info("Attempting to grab Legion Go HID device...")
+            since = hotplug.generation
+            if not get_lgo_hid_device():
+                # Without the uevent socket nothing reports new hidraw nodes, so look again later.
+                timeout = None if hotplug.monitor_type == "netlink" else DETECT_DELAY
+                await hotplug.wait_for_device(since, [hotplug.HIDRAW], timeout)
+
+def log_frame(frame, active_keys):
+    for seed_event in frame:
+        handycon.logger.debug(f"Seed Value: {seed_event.value}, Seed Code: {seed_event.code}, Seed Type: {seed_event.type}.")
+    if active_keys != []:
+        handycon.logger.debug(f"Active Keys: {active_keys}")
+    else:
+        handycon.logger.debug("No active keys")
+    if handycon.event_queue:
+        handycon.logger.debug(f"Queued events: {handycon.event_queue}")
+    else:
+        handycon.logger.debug("No active events.")
+
+
+# Runs the frames of a keyboard through the driver.
+async def dispatch_frames(frame_source, name):
+    chord_table = handycon.handheld.CHORDS
+    process_frame = handycon.handheld.process_frame
+    async for frame, active_keys in frame_source:
+        # Drop frames the driver can't act on before doing any other work.
+        if not chords.is_interesting(chord_table, frame, active_keys):
+            metrics.counters[("filtered", name)] += 1
+            continue
+
+        # Debugging variables
+        if handycon.logger.isEnabledFor(logging.DEBUG):
+            log_frame(frame, active_keys)
+
+        # Capture keyboard events and translate them to mapped events.
+        await process_frame(frame, active_keys)
 
-        await asyncio.sleep(delay_value)
 
 # Captures keyboard events and translates them to virtual device events.
 async def capture_keyboard_events():
@@ -259,85 +310,25 @@ async def capture_keyboard_events():
     while handycon.running:
         if handycon.keyboard_device:
             try:
-                async for seed_event in handycon.keyboard_device.async_read_loop():
-                    # Loop variables
-                    active_keys = handycon.keyboard_device.active_keys()
-
-                    # Debugging variables
-                    handycon.logger.debug(f"Seed Value: {seed_event.value}, Seed Code: {seed_event.code}, Seed Type: {seed_event.type}.")
-                    if active_keys != []:
-                        handycon.logger.debug(f"Active Keys: {active_keys}")
-                    else:
-                        handycon.logger.debug("No active keys")
-                    if handycon.event_queue != []:
-                        handycon.logger.debug(f"Queued events: {handycon.event_queue}")
-                    else:
-                        handycon.logger.debug("No active events.")
-
-                    # Capture keyboard events and translate them to mapped events.
-                    match handycon.system_type:
-                        case "ALY_GEN1":
-                            await ally_gen1.process_event(seed_event, active_keys)
-                        case "ANB_GEN1":
-                            await anb_gen1.process_event(seed_event, active_keys)
-                        case "AOK_GEN1":
-                            await aok_gen1.process_event(seed_event, active_keys)
-                        case "AOK_GEN2":
-                            await aok_gen2.process_event(seed_event, active_keys)
-                        case "AYA_GEN1":
-                            await aya_gen1.process_event(seed_event, active_keys)
-                        case "AYA_GEN2":
-                            await aya_gen2.process_event(seed_event, active_keys)
-                        case "AYA_GEN3":
-                            await aya_gen3.process_event(seed_event, active_keys)
-                        case "AYA_GEN4":
-                            await aya_gen4.process_event(seed_event, active_keys)
-                        case "AYA_GEN5":
-                            await aya_gen5.process_event(seed_event, active_keys)
-                        case "AYA_GEN6":
-                            await aya_gen6.process_event(seed_event, active_keys)
-                        case "AYA_GEN7":
-                            await aya_gen7.process_event(seed_event, active_keys)
-                        case "AYN_GEN1":
-                            await ayn_gen1.process_event(seed_event, active_keys)
-                        case "AYN_GEN2":
-                            await ayn_gen2.process_event(seed_event, active_keys)
-                        case "AYN_GEN3":
-                            await ayn_gen3.process_event(seed_event, active_keys)
-                        case "GO_GEN1":
-                            await go_gen1.process_event(seed_event, active_keys)
-                        case "GPD_GEN1":
-                            await gpd_gen1.process_event(seed_event, active_keys)
-                        case "GPD_GEN2":
-                            await gpd_gen2.process_event(seed_event, active_keys)
-                        case "GPD_GEN3":
-                            await gpd_gen3.process_event(seed_event, active_keys)
-                        case "OXP_GEN1":
-                            await oxp_gen1.process_event(seed_event, active_keys)
-                        case "OXP_GEN2":
-                            await oxp_gen2.process_event(seed_event, active_keys)
-                        case "OXP_GEN3":
-                            await oxp_gen3.process_event(seed_event, active_keys)
-                        case "OXP_GEN4":
-                            await oxp_gen4.process_event(seed_event, active_keys)
-                        case "OXP_GEN5":
-                            await oxp_gen5.process_event(seed_event, active_keys)
-                        case "OXP_GEN6":
-                            await oxp_gen6.process_event(seed_event, active_keys)
-                        case "OXP_GEN7":
-                            await oxp_gen7.process_event(seed_event, active_keys)
+                # Only wake up for the keys the driver reads.
+                codes = handycon.handheld.CHORDS.codes
+                if not evmask.filter_keys(handycon.keyboard_device, codes):
+                    codes = None
+                key_state = keystate.KeyState(handycon.keyboard_device, codes)
+                await dispatch_frames(frames.read_frames(handycon.keyboard_device, key_state, "keyboard"), "keyboard")
 
             except Exception as err:
                 handycon.logger.error(f"{err} | Error reading events from {handycon.keyboard_device.name}")
                 handycon.logger.error(traceback.format_exc())
-                remove_device(HIDE_PATH, handycon.keyboard_event)
+                remove_device(handycon.keyboard_event)
                 handycon.keyboard_device = None
                 handycon.keyboard_event = None
                 handycon.keyboard_path = None
         else:
             handycon.logger.info("Attempting to grab keyboard device...")
-            get_keyboard()
-            await asyncio.sleep(DETECT_DELAY)
+            since = hotplug.generation
+            if not get_keyboard():
+                await hotplug.wait_for_device(since, [(handycon.KEYBOARD_NAME, handycon.KEYBOARD_ADDRESS, e.EV_KEY)])
 
 
 # Captures keyboard events and translates them to virtual device events.
@@ -348,41 +339,28 @@ async def capture_keyboard_2_events():
     while handycon.running:
         if handycon.keyboard_2_device:
             try:
-                async for seed_event_2 in handycon.keyboard_2_device.async_read_loop():
-                    # Loop variables
-                    active_keys_2 = handycon.keyboard_2_device.active_keys()
-
-                    # Debugging variables
-                    handycon.logger.debug(f"Seed Value: {seed_event_2.value}, Seed Code: {seed_event_2.code}, Seed Type: {seed_event_2.type}.")
-                    if active_keys_2 != []:
-                        handycon.logger.debug(f"Active Keys: {active_keys_2}")
-                    else:
-                        handycon.logger.debug("No active keys")
-                    if handycon.event_queue != []:
-                        handycon.logger.debug(f"Queued events: {handycon.event_queue}")
-                    else:
-                        handycon.logger.debug("No active events.")
-
-                    # Capture keyboard events and translate them to mapped events.
-                    match handycon.system_type:
-                        case "ALY_GEN1":
-                           await ally_gen1.process_event(seed_event_2, active_keys_2)
-                        case "GO_GEN1":
-                           await go_gen1.process_event(seed_event_2, active_keys_2)
+                # Only wake up for the keys the driver reads.
+                codes_2 = handycon.handheld.CHORDS.codes
+                if not evmask.filter_keys(handycon.keyboard_2_device, codes_2):
+                    codes_2 = None
+                key_state_2 = keystate.KeyState(handycon.keyboard_2_device, codes_2)
+                await dispatch_frames(frames.read_frames(handycon.keyboard_2_device, key_state_2, "keyboard_2"), "keyboard_2")
 
             except Exception as err:
                 handycon.logger.error(f"{err} | Error reading events from {handycon.keyboard_2_device.name}")
                 handycon.logger.error(traceback.format_exc())
-                remove_device(HIDE_PATH, handycon.keyboard_2_event)
+                remove_device(handycon.keyboard_2_event)
                 handycon.keyboard_2_device = None
                 handycon.keyboard_2_event = None
                 handycon.keyboard_2_path = None
         else:
             handycon.logger.info("Attempting to grab keyboard device 2...")
-            get_keyboard_2()
-            await asyncio.sleep(DETECT_DELAY)
+            since = hotplug.generation
+            if not get_keyboard_2():
+                await hotplug.wait_for_device(since, [(handycon.KEYBOARD_2_NAME, handycon.KEYBOARD_2_ADDRESS, e.EV_KEY)])
 
 
+# Forwards the gamepad to the virtual controller.
 async def capture_controller_events():
     global handycon
 
@@ -390,24 +368,21 @@ async def capture_controller_events():
     while handycon.running:
         if handycon.controller_device:
             try:
-                async for event in handycon.controller_device.async_read_loop():
-                    # Block FF events, or get infinite recursion. Up to you I guess...
-                    if event.type in [e.EV_FF, e.EV_UINPUT]:
-                        continue
-
-                    # Output the event.
-                    emit_event(event)
+                # Forward raw frames to the virtual controller. FF events are blocked, or we
+                # get infinite recursion.
+                await passthrough.forward_device(handycon.controller_device, handycon.ui_device, "controller")
             except Exception as err:
                 handycon.logger.error(f"{err} | Error reading events from {handycon.controller_device.name}.")
                 handycon.logger.error(traceback.format_exc())
-                remove_device(HIDE_PATH, handycon.controller_event)
+                remove_device(handycon.controller_event)
                 handycon.controller_device = None
                 handycon.controller_event = None
                 handycon.controller_path = None
         else:
             handycon.logger.info("Attempting to grab controller device...")
-            get_controller()
-            await asyncio.sleep(DETECT_DELAY)
+            since = hotplug.generation
+            if not get_controller():
+                await hotplug.wait_for_device(since, [(handycon.GAMEPAD_NAME, handycon.GAMEPAD_ADDRESS)])
 
 
 # Captures power events and handles long or short press events.
@@ -417,11 +392,8 @@ async def capture_power_events():
     while handycon.running:
         if handycon.power_device:
             try:
-                async for event in handycon.power_device.async_read_loop():
-                    handycon.logger.debug(f"Got event: {event.type} | {event.code} | {event.value}")
-                    if event.type == e.EV_KEY and event.code == 116: # KEY_POWER
-                        if event.value == 0:
-                            handle_power_action()
+                device = handycon.power_device
+                await reactor.watch(device.fd, "power", lambda fd: handle_power_events(device, "power"))
 
             except Exception as err:
                 handycon.logger.error(f"{err} | Error reading events from power device.")
@@ -430,11 +402,8 @@ async def capture_power_events():
 
         elif handycon.power_device_2 and not handycon.power_device:
             try:
-                async for event in handycon.power_device_2.async_read_loop():
-                    handycon.logger.debug(f"Got event: {event.type} | {event.code} | {event.value}")
-                    if event.type == e.EV_KEY and event.code == 116: # KEY_POWER
-                        if event.value == 0:
-                            handle_power_action()
+                device = handycon.power_device_2
+                await reactor.watch(device.fd, "power_2", lambda fd: handle_power_events(device, "power_2"))
 
             except Exception as err:
                 handycon.logger.error(f"{err} | Error reading events from power device.")
@@ -442,14 +411,33 @@ async def capture_power_events():
                 handycon.power_device_2 = None
 
         else:
-            handycon.logger.info("Attempting to grab controller device...")
-            get_powerkey()
-            await asyncio.sleep(DETECT_DELAY)
+            handycon.logger.info("Attempting to grab power button...")
+            since = hotplug.generation
+            if not get_powerkey():
+                await hotplug.wait_for_device(since, [
+                    ('Power Button', handycon.POWER_BUTTON_PRIMARY, e.EV_KEY),
+                    ('Power Button', handycon.POWER_BUTTON_SECONDARY, e.EV_KEY),
+                    ])
+
+
+# Reads the queued events of a power button. Called by the reactor.
+def handle_power_events(device, name):
+    events = reactor.read_events(device)
+    if recording.recorder and events:
+        recording.recorder.write_events(name, recording.POWER, events)
+    for event in events:
+        handycon.logger.debug(f"Got event: {event.type} | {event.code} | {event.value}")
+        if event.type == e.EV_KEY and event.code == 116: # KEY_POWER
+            if event.value == 0:
+                handle_power_action()
+    return len(events)
 
 
 # Performs specific power actions based on user config.
 def handle_power_action():
     handycon.logger.debug(f"Power Action: {handycon.power_action}")
+    if handycon.dry_run:
+        return
     match handycon.power_action:
         case "Suspend":
             # For DeckUI Sessions
@@ -472,12 +460,17 @@ def handle_power_action():
 async def capture_ff_events():
     global handycon
 
-    ff_effect_id_set = set()
+    await reactor.watch(handycon.ui_device.fd, "ff", lambda fd: handle_ff_events())
 
-    async for event in handycon.ui_device.async_read_loop():
+
+# Reads the queued events of the virtual device. Called by the reactor.
+def handle_ff_events():
+    global handycon
+
+    events = reactor.read_events(handycon.ui_device)
+    for event in events:
+        # Nothing to forward to until the controller is grabbed.
         if handycon.controller_device is None:
-            # Slow down the loop so we don't waste millions of cycles and overheat our controller.
-            await asyncio.sleep(DETECT_DELAY)
             continue
 
         if event.type == e.EV_FF:
@@ -505,6 +498,7 @@ async def capture_ff_events():
                 effect.id = effect_id
 
                 ff_effect_id_set.add(effect_id)
+                metrics.counters[("ff_uploads", "controller")] += 1
 
                 upload.retval = 0
             except IOError as err:
@@ -520,6 +514,7 @@ async def capture_ff_events():
             try:
                 handycon.controller_device.erase_effect(erase.effect_id)
                 ff_effect_id_set.remove(erase.effect_id)
+                metrics.counters[("ff_erases", "controller")] += 1
                 erase.retval = 0
             except IOError as err:
                 handycon.logger.error(f"{err} | Error erasing effect {erase.effect_id}.")
@@ -527,49 +522,55 @@ async def capture_ff_events():
                 erase.retval = -1
 
             handycon.ui_device.end_erase(erase)
+    return len(events)
 
 
 def restore_device(event, path):
     # Both devices threads will attempt this, so ignore if they have been moved.
     try:
-        move(str(HIDE_PATH / event), path)
+        backend.current.restore(path, event)
     except FileNotFoundError:
         pass
 
 
 def restore_hidden():
-    hidden_events = os.listdir(HIDE_PATH)
-    if len(hidden_events) == 0:
-        return
-    for hidden_event in hidden_events:
-        handycon.logger.debug(f'Restoring {hidden_event}')
-        move(str(HIDE_PATH / hidden_event), "/dev/input/" + hidden_event)
+    backend.current.restore_hidden()
 
 
-def remove_device(path, event):
+# Deletes the hidden node of a device that went away.
+def remove_device(event):
     try:
-        os.remove(str(path / event))
+        backend.current.remove(event)
     except FileNotFoundError:
         pass
 
 # Emits passed or generated events to the virtual controller.
 # This shouldn't be called directly for custom events, only to pass realtime events.
 # Use emit_now and the device's event_queue.
+# Events are handed to the output scheduler BUTTON_DELAY apart so the capture loops can
+# keep reading while a long action plays out.
 async def emit_events(events: list):
+    scheduler.schedule(actions.pack_events(events), handycon.BUTTON_DELAY)
 
-    for event in events:
-        emit_event(event)
-        # Pause between multiple events, but not after the last one in the list.
-        if event != events[len(events)-1]:
-            await asyncio.sleep(handycon.BUTTON_DELAY)
+
+# Writes a packed SYN_REPORT frame to the virtual device.
+def write_frame(frame):
+    global handycon
+    if handycon.logger.isEnabledFor(logging.DEBUG):
+        handycon.logger.debug(f"Emitting frame: {actions.EVENT.unpack_from(frame)}")
+    os.write(handycon.ui_device.fd, frame)
+    metrics.counters[("frames_out", "uinput")] += 1
 
 
 # Emit a single event. Skips some logic checks for optimization.
 def emit_event(event):
     global handycon
-    handycon.logger.debug(f"Emitting event: {event}")
+    if handycon.logger.isEnabledFor(logging.DEBUG):
+        handycon.logger.debug(f"Emitting event: {event}")
     handycon.ui_device.write_event(event)
     handycon.ui_device.syn()
+    latency.record("device", "keyboard", event.sec, event.usec)
+    metrics.counters[("events_out", "keyboard")] += 1
 
 
 # Generates events from an event list. Can be called directly or when looping through
@@ -582,12 +583,14 @@ async def emit_now(seed_event, event_list, value):
         handycon.logger.error("emit_now received malfirmed event_list. No action") 
         return
 
+    action = actions.get_action(event_list)
+
     # Handle string events
-    if type(event_list[0]) == str:
+    if action.command:
         if value == 0:
             handycon.logger.debug("Received string event with value 0. KEY_UP event not required. Skipping")
             return
-        match event_list[0]:
+        match action.command:
             case "Open Chimera":
                 handycon.logger.debug("Open Chimera")
                 handycon.launch_chimera()
@@ -599,45 +602,42 @@ async def emit_now(seed_event, event_list, value):
                 handycon.logger.debug("Toggle Performance")
                 await toggle_performance()
             case "Hibernate", "Suspend", "Shutdown":
-                handycon.logger.error(f"Power mode {event_list[0]} set to button action. Check your configuration file.")
+                handycon.logger.error(f"Power mode {action.command} set to button action. Check your configuration file.")
             case _:
-                handycon.logger.warn(f"{event_list[0]} not defined.")
+                handycon.logger.warn(f"{action.command} not defined.")
         return
 
-    handycon.logger.debug(f'Event list: {event_list}')
-    events = []
+    if handycon.logger.isEnabledFor(logging.DEBUG):
+        handycon.logger.debug(f'Event list: {event_list}')
+
+    # Time from the input that triggered the action to its last frame going out.
+    trace = None
+    if seed_event:
+        trace = (action.name, seed_event.sec, seed_event.usec)
 
+    # Single events go through the scheduler too so they can't overtake a pending action.
     if value == 0:
-        for button_event in reversed(event_list):
-            new_event = InputEvent(seed_event.sec, seed_event.usec, button_event[0], button_event[1], value)
-            events.append(new_event)
+        scheduler.schedule(action.release, handycon.BUTTON_DELAY, trace)
     else:
-        for button_event in event_list:
-            new_event = InputEvent(seed_event.sec, seed_event.usec, button_event[0], button_event[1], value)
-            events.append(new_event)
-
-    size = len(events)
-    if size > 1:
-        await emit_events(events)
-    elif size == 1:
-        emit_event(events[0])
+        scheduler.schedule(action.press, handycon.BUTTON_DELAY, trace)
 
 
 async def handle_key_down(seed_event, queued_event):
-    handycon.event_queue.append(queued_event)
-    if queued_event in INSTANT_EVENTS:
+    handycon.event_queue.add(queued_event)
+    if actions.get_action(queued_event).instant:
         await handycon.emit_now(seed_event, queued_event, 1)
 
 
 async def handle_key_up(seed_event, queued_event):
-    if queued_event in INSTANT_EVENTS:
-        handycon.event_queue.remove(queued_event)
+    action = actions.get_action(queued_event)
+    if action.instant:
+        handycon.event_queue.discard(queued_event)
         await handycon.emit_now(seed_event, queued_event, 0)
-    elif queued_event in QUEUED_EVENTS:
+    elif action.queued:
         # Create list of events to fire.
         # Handle new button presses.
         if not handycon.last_button:
-            handycon.event_queue.remove(queued_event)
+            handycon.event_queue.discard(queued_event)
             handycon.last_button = queued_event
             await handycon.emit_now(seed_event, queued_event, 1)
             return
@@ -651,18 +651,24 @@ async def handle_key_up(seed_event, queued_event):
 async def toggle_performance():
     global handycon
 
+    # Don't hold up the capture loop for a rumble pattern nobody will feel.
     if handycon.performance_mode == "--max-performance":
         handycon.performance_mode = "--power-saving"
-        await do_rumble(0, 100, 1000, 0)
-        await asyncio.sleep(FF_DELAY)
-        await do_rumble(0, 100, 1000, 0)
+        if handycon.controller_device:
+            await do_rumble(0, 100, 1000, 0)
+            await asyncio.sleep(FF_DELAY)
+            await do_rumble(0, 100, 1000, 0)
     else:
         handycon.performance_mode = "--max-performance"
-        await do_rumble(0, 500, 1000, 0)
-        await asyncio.sleep(FF_DELAY)
-        await do_rumble(0, 75, 1000, 0)
-        await asyncio.sleep(FF_DELAY)
-        await do_rumble(0, 75, 1000, 0)
+        if handycon.controller_device:
+            await do_rumble(0, 500, 1000, 0)
+            await asyncio.sleep(FF_DELAY)
+            await do_rumble(0, 75, 1000, 0)
+            await asyncio.sleep(FF_DELAY)
+            await do_rumble(0, 75, 1000, 0)
+
+    if handycon.dry_run:
+        return
 
     ryzenadj_command = f'ryzenadj {handycon.performance_mode}'
     run = os.popen(ryzenadj_command, 'r', 1).read().strip()
@@ -693,7 +699,7 @@ def make_controller():
     global handycon
     # 0x045e, 
     # Create the virtual controller.
-    handycon.ui_device = UInput(
+    handycon.ui_device = backend.current.create_uinput(
             CONTROLLER_EVENTS,
             name='Handheld Controller',
             bustype=0x3,
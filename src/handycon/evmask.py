@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# This file is part of Handheld Game Console Controller System (HandyGCCS)
+# Copyright 2022-2023 Derek J. Clark <derekjohn.clark@gmail.com>
+
+## Python Modules
+import ctypes
+import fcntl
+import struct
+import traceback
+
+# Local modules
+from .constants import *
+
+handycon = None
+
+# _IOW('E', 0x93, struct input_mask)
+EVIOCSMASK = 0x40104593
+
+# struct input_mask: __u32 type, __u32 codes_size, __u64 codes_ptr.
+INPUT_MASK = struct.Struct("IIQ")
+
+def set_handycon(handheld_controller):
+    global handycon
+    handycon = handheld_controller
+
+
+# Sets which codes of ev_type the kernel delivers to our fd. For EV_SYN the "codes" are
+# the event types to deliver. SYN events themselves are never filtered and the kernel
+# drops frames that end up empty, so filtered events don't wake us at all.
+def set_mask(fd, ev_type, codes):
+    bits = 0
+    for code in codes:
+        bits |= 1 << code
+    size = max((bits.bit_length() + 7) // 8, 1)
+
+    # The kernel reads the bitmap as an array of longs, which is little endian bytes on
+    # the x86 handhelds we support.
+    mask = ctypes.create_string_buffer(bits.to_bytes(size, "little"), size)
+    fcntl.ioctl(fd, EVIOCSMASK, INPUT_MASK.pack(ev_type, size, ctypes.addressof(mask)))
+
+
+# Limits a grabbed keyboard to the key codes in codes. Everything else, including MSC_SCAN,
+# LED and relative events, stays in the kernel. Returns False if the kernel doesn't support
+# event masks (pre 4.4), in which case the device is left unfiltered.
+def filter_keys(device, codes):
+    try:
+        set_mask(device.fd, e.EV_SYN, [e.EV_KEY])
+        set_mask(device.fd, e.EV_KEY, codes)
+    except OSError as err:
+        handycon.logger.warn(f"{err} | Unable to set event mask on {device.name}. Reading all events.")
+        handycon.logger.debug(traceback.format_exc())
+        return False
+    handycon.logger.debug(f"Event mask on {device.name}: {sorted(codes)}")
+    return True
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# This file is part of Handheld Game Console Controller System (HandyGCCS)
+# Copyright 2022-2023 Derek J. Clark <derekjohn.clark@gmail.com>
+
+# Local modules
+from .constants import *
+from . import metrics
+from . import reactor
+from . import recording
+
+
+# Groups the events of a device into the frames the kernel delimits with SYN_REPORT and
+# yields (frame, active_keys) once per frame. The frame ends with its SYN_REPORT and
+# active_keys is the key state after the whole frame, so a chord whose keys arrive in the
+# same frame is only ever seen complete.
+#
+# After a SYN_DROPPED everything up to and including the next SYN_REPORT is discarded and
+# key_state reads the held keys from the kernel again. batches replaces the device's reads,
+# which is how replay.py feeds in a recording.
+async def read_frames(device, key_state, name, batches=None):
+    if batches is None:
+        batches = reactor.read_batches(device, name)
+    frame = []
+    dropped = False
+    async for events in batches:
+        metrics.counters[("events_in", name)] += len(events)
+        if recording.recorder:
+            recording.recorder.write_events(name, recording.KEYBOARD, events)
+        for event in events:
+            active_keys = key_state.update(event)
+            if event.type != e.EV_SYN:
+                if not dropped:
+                    frame.append(event)
+                continue
+
+            if event.code == e.SYN_DROPPED:
+                metrics.counters[("dropped", name)] += 1
+                frame = []
+                dropped = True
+            elif event.code == e.SYN_REPORT:
+                if dropped:
+                    dropped = False
+                    continue
+                frame.append(event)
+                yield frame, active_keys
+                frame = []
+
+
+# Returns the key event in a frame that decided the held keys: the last press, or the last
+# release once nothing is held. None if the frame has no key events.
+def get_seed(frame, active_keys):
+    seed = None
+    for event in frame:
+        if event.type != e.EV_KEY:
+            continue
+        if not active_keys or event.value != 0 or seed is None:
+            seed = event
+    return seed
@@ -4,6 +4,8 @@
 
 from evdev import InputDevice, InputEvent, UInput, ecodes as e, list_devices, ff
 
+from .. import chords
+
 handycon = None
 
 def init_handheld(handheld_controller):
@@ -19,51 +21,22 @@ def init_handheld(handheld_controller):
     handycon.KEYBOARD_NAME = 'AT Translated Set 2 keyboard'
 
 
-# Captures keyboard events and translates them to virtual device events.
-async def process_event(seed_event, active_keys):
-    global handycon
-
-    # Button map shortcuts for easy reference.
-    button1 = handycon.button_map["button1"]  # Default Screenshot
-    button2 = handycon.button_map["button2"]  # Default QAM
-    button3 = handycon.button_map["button3"]  # Default ESC
-    button4 = handycon.button_map["button4"]  # Default OSK
-    button5 = handycon.button_map["button5"]  # Default MODE
-
-    ## Loop variables
-    button_on = seed_event.value
-
-    # Automatically pass default keycodes we dont intend to replace.
-    if seed_event.code in [e.KEY_VOLUMEDOWN, e.KEY_VOLUMEUP]:
-        handycon.emit_event(seed_event)
-
-    # BUTTON 1 (Default: Screenshot) WIN button
-    if active_keys == [125] and button_on == 1 and button1 not in handycon.event_queue and handycon.shutdown == False:
-        await handycon.handle_key_down(seed_event, button1)
-    elif active_keys == [] and seed_event.code == 125 and button_on == 0 and button6 in handycon.event_queue:
-        await handycon.handle_key_up(seed_event, button1)
+# Keyboard chords that map to buttons. Compiled once at import.
+CHORDS = chords.ChordTable([
+        # BUTTON 1 (Default: Screenshot) WIN button
+        chords.Chord("button1", press=[[125]], release=[125], ignore_shutdown=True),
 
-    # BUTTON 2 (Default: QAM) TM Button
-    if active_keys == [97, 100, 111] and button_on == 1 and button2 not in handycon.event_queue:
-        await handycon.handle_key_down(seed_event, button2)
-    elif active_keys == [] and seed_event.code in [97, 100, 111] and button_on == 0 and button2 in handycon.event_queue:
-        await handycon.handle_key_up(seed_event, button2)
+        # BUTTON 2 (Default: QAM) TM Button
+        chords.Chord("button2", press=[[97, 100, 111]], release=[97, 100, 111]),
 
-    # BUTTON 3 (Default: ESC) ESC Button
-    if active_keys == [1] and seed_event.code == 1 and button_on == 1 and button3 not in handycon.event_queue:
-        await handycon.handle_key_down(seed_event, button3)
-    elif active_keys == [] and seed_event.code == 1 and button_on == 0 and button3 in handycon.event_queue:
-        await handycon.handle_key_up(seed_event, button3)
+        # BUTTON 3 (Default: ESC) ESC Button
+        chords.Chord("button3", press=[[1]], release=[1], code=1),
 
-    # BUTTON 4 (Default: OSK) KB Button
-    if active_keys == [24, 97, 125] and button_on == 1 and button4 not in handycon.event_queue:
-        await handycon.handle_key_down(seed_event, button4)
-    elif active_keys == [] and seed_event.code in [24, 97, 125] and button_on == 0 and button4 in handycon.event_queue:
-        await handycon.handle_key_up(seed_event, button4)
+        # BUTTON 4 (Default: OSK) KB Button
+        chords.Chord("button4", press=[[24, 97, 125]], release=[24, 97, 125]),
+        ], passthrough=[e.KEY_VOLUMEDOWN, e.KEY_VOLUMEUP], reset_shutdown=True)
 
-    # Handle L_META from power button
-    elif active_keys == [] and seed_event.code == 125 and button_on == 0 and  handycon.event_queue == [] and handycon.shutdown == True:
-        handycon.shutdown = False
 
-    if handycon.last_button:
-        await handycon.handle_key_up(seed_event, handycon.last_button)
+# Captures a frame of keyboard events and translates them to virtual device events.
+async def process_frame(frame, active_keys):
+    await chords.process_frame(CHORDS, frame, active_keys)
@@ -4,6 +4,8 @@
 
 from evdev import InputDevice, InputEvent, UInput, ecodes as e, list_devices, ff
 
+from .. import chords
+
 handycon = None
 
 def init_handheld(handheld_controller):
@@ -19,36 +21,16 @@ def init_handheld(handheld_controller):
     handycon.KEYBOARD_NAME = 'AT Translated Set 2 keyboard'
 
 
-# Captures keyboard events and translates them to virtual device events.
-async def process_event(seed_event, active_keys):
-    global handycon
-
-    # Button map shortcuts for easy reference.
-    button2 = handycon.button_map["button2"]  # Default QAM
-    button5 = handycon.button_map["button5"]  # Default MODE
-
-    ## Loop variables
-    button_on = seed_event.value
-
-    # Automatically pass default keycodes we dont intend to replace.
-    if seed_event.code in [e.KEY_VOLUMEDOWN, e.KEY_VOLUMEUP]:
-        handycon.emit_event(seed_event)
-
-    # BUTTON 2 (Default: QAM) Small Button
-    if active_keys in [[40, 133], [32, 125]] and button_on == 1 and button2 not in handycon.event_queue:
-        await handycon.handle_key_down(seed_event, button2)
-    elif active_keys == [] and seed_event.code in [32, 40, 125, 133] and button_on == 0 and button2 in handycon.event_queue:
-        await handycon.handle_key_up(seed_event, button2)
+# Keyboard chords that map to buttons. Compiled once at import.
+CHORDS = chords.ChordTable([
+        # BUTTON 2 (Default: QAM) Small Button
+        chords.Chord("button2", press=[[40, 133], [32, 125]], release=[32, 40, 125, 133]),
 
-    # BUTTON 5 (Default: MODE) Big button
-    if active_keys in [[96, 105, 133], [88, 97, 125]] and button_on == 1 and button5 not in handycon.event_queue:
-        await handycon.handle_key_down(seed_event, button5)
-    elif active_keys == [] and seed_event.code in [88, 96, 97, 105, 125, 133] and button_on == 0 and button5 in handycon.event_queue:
-        await handycon.handle_key_up(seed_event, button5)
+        # BUTTON 5 (Default: MODE) Big button
+        chords.Chord("button5", press=[[96, 105, 133], [88, 97, 125]], release=[88, 96, 97, 105, 125, 133]),
+        ], passthrough=[e.KEY_VOLUMEDOWN, e.KEY_VOLUMEUP], reset_shutdown=True)
 
-    # Handle L_META from power button
-    elif active_keys == [] and seed_event.code == 125 and button_on == 0 and handycon.event_queue == [] and handycon.shutdown == True:
-        handycon.shutdown = False
 
-    if handycon.last_button:
-        await handycon.handle_key_up(seed_event, handycon.last_button)
+# Captures a frame of keyboard events and translates them to virtual device events.
+async def process_frame(frame, active_keys):
+    await chords.process_frame(CHORDS, frame, active_keys)
@@ -4,6 +4,8 @@
 
 from evdev import InputDevice, InputEvent, UInput, ecodes as e, list_devices, ff
 
+from .. import chords
+
 handycon = None
 
 def init_handheld(handheld_controller):
@@ -19,51 +21,22 @@ def init_handheld(handheld_controller):
     handycon.KEYBOARD_NAME = 'AT Translated Set 2 keyboard'
 
 
-# Captures keyboard events and translates them to virtual device events.
-async def process_event(seed_event, active_keys):
-    global handycon
-
-    # Button map shortcuts for easy reference.
-    button1 = handycon.button_map["button1"]  # Default Screenshot
-    button2 = handycon.button_map["button2"]  # Default QAM
-    button3 = handycon.button_map["button3"]  # Default ESC
-    button4 = handycon.button_map["button4"]  # Default OSK
-    button5 = handycon.button_map["button5"]  # Default MODE
-
-    ## Loop variables
-    button_on = seed_event.value
-
-    # Automatically pass default keycodes we dont intend to replace.
-    if seed_event.code in [e.KEY_VOLUMEDOWN, e.KEY_VOLUMEUP]:
-        handycon.emit_event(seed_event)
-
-    # BUTTON 1 (Default: Screenshot/Launch Chiumera) LC Button
-    if active_keys == [87, 97, 125] and button_on == 1 and button1 not in handycon.event_queue:
-        await handycon.handle_key_down(seed_event, button1)
-    elif active_keys == [] and seed_event.code in [87, 97, 125] and button_on == 0 and button1 in handycon.event_queue:
-        await handycon.handle_key_up(seed_event, button1)
+# Keyboard chords that map to buttons. Compiled once at import.
+CHORDS = chords.ChordTable([
+        # BUTTON 1 (Default: Screenshot/Launch Chiumera) LC Button
+        chords.Chord("button1", press=[[87, 97, 125]], release=[87, 97, 125]),
 
-    # BUTTON 2 (Default: QAM) Small Button
-    if active_keys == [32, 125] and button_on == 1 and button2 not in handycon.event_queue:
-        await handycon.handle_key_down(seed_event, button2)
-    elif active_keys == [] and seed_event.code in [32, 40, 125, 133] and button_on == 0 and button2 in handycon.event_queue:
-        await handycon.handle_key_up(seed_event, button2)
+        # BUTTON 2 (Default: QAM) Small Button
+        chords.Chord("button2", press=[[32, 125]], release=[32, 40, 125, 133]),
 
-    # BUTTON 4 (Default: OSK) RC Button
-    if active_keys == [68, 97, 125] and button_on == 1 and button4 not in handycon.event_queue:
-        await handycon.handle_key_down(seed_event, button4)
-    elif active_keys == [] and seed_event.code in [68, 97, 125] and button_on == 0 and button4 in handycon.event_queue:
-        await handycon.handle_key_up(seed_event, button4)
+        # BUTTON 4 (Default: OSK) RC Button
+        chords.Chord("button4", press=[[68, 97, 125]], release=[68, 97, 125]),
 
-    # BUTTON 5 (Default: MODE) Big button
-    if active_keys == [88, 97, 125] and button_on == 1 and button5 not in handycon.event_queue:
-        await handycon.handle_key_down(seed_event, button5)
-    elif active_keys == [] and seed_event.code in [88, 97, 125] and button_on == 0 and button5 in handycon.event_queue:
-        await handycon.handle_key_up(seed_event, button5)
+        # BUTTON 5 (Default: MODE) Big button
+        chords.Chord("button5", press=[[88, 97, 125]], release=[88, 97, 125]),
+        ], passthrough=[e.KEY_VOLUMEDOWN, e.KEY_VOLUMEUP], reset_shutdown=True)
 
-    # Handle L_META from power button
-    elif active_keys == [] and seed_event.code == 125 and button_on == 0 and handycon.event_queue == [] and handycon.shutdown == True:
-        handycon.shutdown = False
 
-    if handycon.last_button:
-        await handycon.handle_key_up(seed_event, handycon.last_button)
+# Captures a frame of keyboard events and translates them to virtual device events.
+async def process_frame(frame, active_keys):
+    await chords.process_frame(CHORDS, frame, active_keys)
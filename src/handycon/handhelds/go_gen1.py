@@ -1,10 +1,10 @@
 #!/usr/bin/env python3
 # This file is part of Handheld Game Console Controller System (HandyGCCS)
 # Copyright 2022-2023 Derek J. Clark <derekjohn.clark@gmail.com>
-import asyncio
 import sys
 import time
 from evdev import InputDevice, InputEvent, UInput, ecodes as e, list_devices, ff
+from .. import chords
 from .. import constants as cons
 from enum import Enum
 from evdev import ecodes
@@ -13,6 +13,9 @@ handycon = None
 gyro_on = False
 hid_qam = False
 
+# Button bits of the last HID report, see decode_buttons.
+hid_buttons = 0
+
 # STEAM res[18] == 128
 # QAM res[18] == 64
 # Y1 res[20] = 128
@@ -29,9 +32,22 @@ class HidButtons(Enum):
     M2 = [20, 8]
     M3 = [20, 4]
 
-def is_button(hid_event, button):
+# The button bytes of a report as one big endian int, so a button is a single bit.
+BUTTONS_START = 18
+BUTTONS_END = 21
+
+def button_bit(button):
     [idx, value] = button.value
-    return hid_event[idx] == value
+    return value << (8 * (BUTTONS_END - 1 - idx))
+
+def decode_buttons(hid_event):
+    return int.from_bytes(hid_event[BUTTONS_START:BUTTONS_END], "big")
+
+# HID button bit: button_map key it emits.
+HID_BUTTON_MAP = {
+        button_bit(HidButtons.LEGION_L): "button5",  # Default MODE
+        button_bit(HidButtons.LEGION_R): "button2",  # Default QAM
+        }
 
 class Gyro(Enum):
     LEFT_GYRO = 0x01
@@ -42,44 +58,40 @@ class GyroRemapActions(Enum):
     LEFT_JOYSTICK = 0x01
     RIGHT_JOYSTICK = 0x02
 
-# Emit a single event. Skips some logic checks for optimization.
-def emit_event(event):
-    global handycon
-    # handycon.logger.debug(f"Emitting event: {event}")
-    # file1 = open("/home/deck/Development/HandyGCCS/logs.txt", "a")
-    # file1.write(f"{event}\n")
-    # file1.close()
-    handycon.ui_device.write_event(event)
-    handycon.ui_device.syn()
-
-async def emit_events(events: list):
-    global handycon
-
-    for event in events:
-        emit_event(event)
-        # Pause between multiple events, but not after the last one in the list.
-        if event != events[len(events)-1]:
-            await asyncio.sleep(handycon.BUTTON_DELAY)
-
-async def handle_button(hid_data, hid_button, new_button):
+async def handle_button(new_button, pressed):
     global handycon
 
-    if(is_button(hid_data, hid_button) and new_button not in handycon.hid_event_queue):
+    if(pressed and new_button not in handycon.hid_event_queue):
         # hid_button_pressed
-        handycon.hid_event_queue.append(new_button)
-        inputs_list = []
-
-        for button in new_button:
-            inputs_list.append(create_button_input_event(button, 1))
-
-        await emit_events(inputs_list)
-    if(is_button(hid_data, hid_button) and new_button in handycon.hid_event_queue):
+        handycon.hid_event_queue.add(new_button)
+        await handycon.emit_now(None, new_button, 1)
+    elif(not pressed and new_button in handycon.hid_event_queue):
         # hid_button_released
-        handycon.hid_event_queue.remove(new_button)
-        inputs_list = []
-        for button in new_button:
-            inputs_list.append(create_button_input_event(button, 0))
-        await emit_events(inputs_list)
+        handycon.hid_event_queue.discard(new_button)
+        await handycon.emit_now(None, new_button, 0)
+
+# Emits only the buttons that changed since the last report.
+async def handle_hid_report(hid_data):
+    global hid_buttons
+
+    buttons = decode_buttons(hid_data)
+    changed = buttons ^ hid_buttons
+    hid_buttons = buttons
+    while changed:
+        bit = changed & -changed
+        changed ^= bit
+        mapping = HID_BUTTON_MAP.get(bit)
+        if mapping:
+            await handle_button(handycon.button_map[mapping], buttons & bit)
+
+# Called when the HID device goes away. Releases any button it still held and forgets the
+# last report, so the first report after a reattach is compared against no buttons.
+async def reset_hid_buttons():
+    global hid_buttons
+
+    for button in list(handycon.hid_event_queue):
+        await handle_button(button, False)
+    hid_buttons = 0
 
 def init_handheld(handheld_controller):
     global handycon
@@ -95,12 +107,21 @@ def init_handheld(handheld_controller):
     handycon.KEYBOARD_2_NAME = '  Legion Controller for Windows  Mouse'
     handycon.KEYBOARD_2_ADDRESS = 'usb-0000:c2:00.3-3/input3'
 
-def create_button_input_event(button_codes, value):
-    t = time.time()
-    sec = int(t)
-    usec = t % 1
-    [type, code] = button_codes 
-    return InputEvent(sec, usec, type, code,  value)
+# Keyboard chords that map to buttons. Compiled once at import.
+CHORDS = chords.ChordTable([
+        # Legion + a = QAM
+        chords.Chord("button2", press=[[29, 56, 111]], release=[29, 56, 111]),
+
+        # Legion + x = keyboard
+        chords.Chord("button4", press=[[99]], release=[99]),
+
+        # Legion + B = MODE
+        chords.Chord("button5", press=[[24, 29, 125]], release=[24, 29, 125]),
+        ])
+
+# Captures a frame of keyboard events and translates them to virtual device events.
+async def process_frame(frame, active_keys):
+    await chords.process_frame(CHORDS, frame, active_keys)
 
 # Captures keyboard events and translates them to virtual device events.
 async def process_event(seed_event, active_keys, hid_data=None):
@@ -108,38 +129,10 @@ async def process_event(seed_event, active_keys, hid_data=None):
     global gyro_on
     global hid_qam
 
-    # Button map shortcuts for easy reference.
-    button2 = handycon.button_map["button2"]  # Default QAM
-    button4 = handycon.button_map["button4"]  # Default OSK
-    button5 = handycon.button_map["button5"]  # Default MODE
-
     # HID events
     if (not seed_event or not active_keys) and hid_data:
-        await handle_button(hid_data, HidButtons.LEGION_L, button5)
-        await handle_button(hid_data, HidButtons.LEGION_R, button2)
+        await handle_hid_report(hid_data)
 
     # not HID events
     else:
-        ## Loop variables
-        button_on = seed_event.value
-
-        # Legion + a = QAM
-        if active_keys == [29, 56, 111] and button_on == 1 and button2 not in handycon.event_queue:
-            await handycon.handle_key_down(seed_event, button2)
-        elif active_keys == [] and seed_event.code in [29, 56, 111] and button_on == 0 and button2 in handycon.event_queue:
-            await handycon.handle_key_up(seed_event, button2)
-
-        # Legion + x = keyboard
-        if active_keys == [99] and button_on == 1 and button4 not in handycon.event_queue:
-            await handycon.handle_key_down(seed_event, button4)
-        elif active_keys == [] and seed_event.code in [99] and button_on == 0 and button4 in handycon.event_queue:
-            await handycon.handle_key_up(seed_event, button4)
-
-        # Legion + B = MODE
-        if active_keys == [24, 29, 125] and button_on == 1 and button5 not in handycon.event_queue:
-            await handycon.handle_key_down(seed_event, button5)
-        elif active_keys == [] and seed_event.code in [24, 29, 125] and button_on == 0 and button5 in handycon.event_queue:
-            await handycon.handle_key_up(seed_event, button5)
-
-        if handycon.last_button:
-            await handycon.handle_key_up(seed_event, handycon.last_button)
\ No newline at end of file
+        await chords.process_event(CHORDS, seed_event, active_keys)
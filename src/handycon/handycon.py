@@ -13,12 +13,22 @@ import warnings
 
 ## Local modules
 from .constants import *
+from . import actions
+from . import backend
+from . import chords
 from . import devices
+from . import evmask
+from . import hotplug
+from . import inventory
+from . import keystate
+from . import latency
+from . import metrics
+from . import reactor
+from . import recording
+from . import registry
+from . import scheduler
 from . import utilities
 
-## Partial imports
-from pathlib import Path
-
 
 warnings.filterwarnings("ignore", category=DeprecationWarning)
 class HandheldController:
@@ -32,15 +42,18 @@ class HandheldController:
     # Session Variables
     config = None
     button_map = {}
-    event_queue = [] # Stores inng button presses to block spam
+    event_queue = actions.Pending() # Stores inng button presses to block spam
     last_button = None
     last_x_val = 0
     last_y_val = 0
     power_action = "Suspend"
     running = False
     shutdown = False
+    dry_run = False # Skip power and performance commands, set when replaying.
 
     # Handheld Config
+    handheld = None
+    system_type = None
     BUTTON_DELAY = 0.00
     CAPTURE_CONTROLLER = False
     CAPTURE_KEYBOARD = False
@@ -80,28 +93,61 @@ class HandheldController:
 
     # Legion Go HID device
     legion_go_hid = None
-    hid_event_queue = []
+    hid_event_queue = actions.Pending()
 
     def __init__(self):
         self.running = True
+        backend.set_handycon(self)
+        chords.set_handycon(self)
         devices.set_handycon(self)
+        evmask.set_handycon(self)
+        hotplug.set_handycon(self)
+        inventory.set_handycon(self)
+        keystate.set_handycon(self)
+        latency.set_handycon(self)
+        metrics.set_handycon(self)
+        reactor.set_handycon(self)
+        recording.set_handycon(self)
+        registry.set_handycon(self)
+        scheduler.set_handycon(self)
         utilities.set_handycon(self)
         self.logger.info("Starting Handhend Game Console Controller Service...")
         if utilities.is_process_running("opengamepadui"):
             self.logger.warn("Detected an OpenGamepadUI Process. Input management not possible. Exiting.")
             exit()
-        Path(HIDE_PATH).mkdir(parents=True, exist_ok=True)
+
+        # Real devices, or scripted ones if HANDYGCCS_FAKE_DEVICES is set.
+        backend.select()
+        backend.current.setup()
         devices.restore_hidden() 
         utilities.get_user()
         self.HAS_CHIMERA_LAUNCHER=os.path.isfile(CHIMERA_LAUNCHER_PATH)
         utilities.id_system()
         utilities.get_config()
+
+        # Record every input stream for replay.py when HANDYGCCS_RECORD names a log file.
+        if os.environ.get(RECORD_ENV):
+            recording.start(os.environ[RECORD_ENV], self.system_type)
         # devices.make_controller()
         # devices.get_lgo_hid_device()
 
         # Run asyncio loop to capture all events.
         self.loop = asyncio.get_event_loop()
 
+        # Wake the capture tasks when their devices appear instead of polling for them.
+        hotplug.start(self.loop)
+
+        # Multiplex every grabbed device through a single epoll.
+        reactor.start(self.loop)
+        backend.current.start(self.loop)
+
+        # Emit timed output events without blocking the capture tasks.
+        asyncio.ensure_future(scheduler.run())
+
+        # Serve live counters for fleet tooling.
+        asyncio.ensure_future(metrics.serve())
+        asyncio.ensure_future(metrics.measure_lag())
+
         # Attach the event loop of each device to the asyncio loop.
         # asyncio.ensure_future(devices.capture_controller_events())
         # asyncio.ensure_future(devices.capture_ff_events())
@@ -109,7 +155,14 @@ class HandheldController:
         # if self.KEYBOARD_2_NAME != '' and self.KEYBOARD_2_ADDRESS != '':
         #     asyncio.ensure_future(devices.capture_keyboard_2_events())
         asyncio.ensure_future(devices.capture_power_events())
+        # The Legion buttons are emitted through the virtual controller, so this stays off
+        # until make_controller is back on. hotplug still wakes it on new hidraw nodes.
         # asyncio.ensure_future(devices.capture_lgo_hid_device())
+
+        # capture_lgo_hid_device applies the Legion profile on every attach. While it is
+        # off, apply it once at startup.
+        if self.system_type == "GO_GEN1":
+            devices.apply_legion_profile()
         self.logger.info("Handheld Game Console Controller Service started.")
 
         # Establish signaling to handle gracefull shutdown.
@@ -143,6 +196,9 @@ class HandheldController:
     async def emit_events(self, events):
         await devices.emit_events(events)
 
+    def write_frame(self, frame):
+        devices.write_frame(frame)
+
     async def emit_now(self, seed_event, event_list, value):
         await devices.emit_now(seed_event, event_list, value)
 
@@ -189,6 +245,10 @@ class HandheldController:
             except IOError as err:
                 pass
         self.logger.info("Devices restored.")
+        latency.report()
+        recording.stop()
+        hotplug.stop(self.loop)
+        reactor.stop(self.loop)
 
         # Kill all tasks. They are infinite loops so we will wait forver.
         for task in [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]:
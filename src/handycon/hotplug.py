@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# This file is part of Handheld Game Console Controller System (HandyGCCS)
+# Copyright 2022-2023 Derek J. Clark <derekjohn.clark@gmail.com>
+
+## Python Modules
+import asyncio
+import ctypes
+import os
+import socket
+import struct
+
+# Local modules
+from .constants import *
+
+## Partial imports
+from pathlib import Path
+
+handycon = None
+
+# Bumped every time an input node is added or removed. Callers snapshot it before
+# scanning so a device that appears mid-scan is never missed.
+generation = 0
+monitor = None
+monitor_type = None
+waiters = []
+
+NETLINK_KOBJECT_UEVENT = 15
+UEVENT_BUFFER_SIZE = 16384
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_MOVED_TO = 0x00000080
+INOTIFY_EVENT = struct.Struct("iIII")
+INPUT_PATH = "/dev/input"
+HIDRAW = "hidraw"
+SYS_INPUT_PATH = "/sys/class/input"
+
+def set_handycon(handheld_controller):
+    global handycon
+    handycon = handheld_controller
+
+
+# Start watching for input devices. Prefer the kernel uevent netlink socket and fall back
+# to inotify on /dev/input. If neither is available callers fall back to polling.
+def start(loop):
+    global monitor
+    global monitor_type
+
+    try:
+        monitor = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM | socket.SOCK_NONBLOCK | socket.SOCK_CLOEXEC, NETLINK_KOBJECT_UEVENT)
+        monitor.bind((0, 1))
+        monitor_type = "netlink"
+        loop.add_reader(monitor.fileno(), read_uevents)
+    except OSError as err:
+        handycon.logger.warn(f"{err} | Unable to open uevent socket. Falling back to inotify.")
+        if monitor:
+            monitor.close()
+        monitor = None
+        try:
+            monitor = open_inotify()
+            monitor_type = "inotify"
+            loop.add_reader(monitor, read_inotify)
+        except OSError as err:
+            handycon.logger.warn(f"{err} | Unable to watch {INPUT_PATH}. Device detection will poll.")
+            monitor = None
+            monitor_type = None
+            return
+    handycon.logger.info(f"Watching for input devices using {monitor_type}.")
+
+
+def stop(loop):
+    global monitor
+    global monitor_type
+
+    if not monitor_type:
+        return
+    if monitor_type == "netlink":
+        loop.remove_reader(monitor.fileno())
+        monitor.close()
+    else:
+        loop.remove_reader(monitor)
+        os.close(monitor)
+    monitor = None
+    monitor_type = None
+    for matches, future in waiters:
+        if not future.done():
+            future.cancel()
+
+
+# Waits until an input device matching one of the (name, phys) pairs, or HIDRAW for any
+# hidraw node, appears. since: the generation read before the caller's last scan.
+async def wait_for_device(since, matches, timeout=None):
+    if not monitor_type:
+        await asyncio.sleep(DETECT_DELAY)
+        return
+
+    # Something changed while the caller was scanning, let it look again.
+    if generation != since:
+        return
+
+    future = asyncio.get_running_loop().create_future()
+    waiter = (matches, future)
+    waiters.append(waiter)
+    try:
+        await asyncio.wait_for(future, timeout)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        waiters.remove(waiter)
+
+
+def open_inotify():
+    libc = ctypes.CDLL(None, use_errno=True)
+    fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+    if fd < 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, os.strerror(errno))
+    if libc.inotify_add_watch(fd, INPUT_PATH.encode(), IN_CREATE | IN_DELETE | IN_MOVED_TO) < 0:
+        errno = ctypes.get_errno()
+        os.close(fd)
+        raise OSError(errno, os.strerror(errno))
+    return fd
+
+
+def read_uevents():
+    while True:
+        try:
+            data = monitor.recv(UEVENT_BUFFER_SIZE)
+        except BlockingIOError:
+            return
+        except OSError as err:
+            # ENOBUFS means the kernel dropped messages. Wake everyone so they rescan.
+            handycon.logger.debug(f"{err} | Lost uevents.")
+            device_added(None)
+            return
+
+        fields = data.split(b'\0')
+        uevent = {}
+        for field in fields[1:]:
+            key, sep, value = field.partition(b'=')
+            if sep:
+                uevent[key] = value
+        action = uevent.get(b'ACTION')
+        if uevent.get(b'SUBSYSTEM') == b'hidraw':
+            if action == b'add':
+                hidraw_added()
+            elif action == b'remove':
+                device_removed()
+            continue
+        if uevent.get(b'SUBSYSTEM') != b'input' or not uevent.get(b'DEVNAME', b'').startswith(b'input/event'):
+            continue
+
+        if action == b'add':
+            device_added(Path("/sys" + uevent[b'DEVPATH'].decode()))
+        elif action == b'remove':
+            device_removed()
+
+
+def read_inotify():
+    try:
+        data = os.read(monitor, UEVENT_BUFFER_SIZE)
+    except BlockingIOError:
+        return
+
+    offset = 0
+    while offset < len(data):
+        wd, mask, cookie, length = INOTIFY_EVENT.unpack_from(data, offset)
+        offset += INOTIFY_EVENT.size
+        name = data[offset:offset + length].rstrip(b'\0').decode()
+        offset += length
+        if not name.startswith("event"):
+            continue
+        if mask & (IN_CREATE | IN_MOVED_TO):
+            device_added(Path(SYS_INPUT_PATH) / name)
+        else:
+            device_removed()
+
+
+# Wakes the waiters for hidraw nodes. Only the uevent socket sees them.
+def hidraw_added():
+    global generation
+
+    generation += 1
+    for matches, future in waiters:
+        if not future.done() and HIDRAW in matches:
+            future.set_result(HIDRAW)
+
+
+def device_removed():
+    global generation
+    generation += 1
+
+
+# Wakes any waiter interested in the device at sys_path. Pass None to wake everyone.
+def device_added(sys_path):
+    global generation
+
+    generation += 1
+    if not waiters:
+        return
+
+    identity = None
+    if sys_path:
+        try:
+            name = (sys_path / "device/name").read_text().rstrip('\n')
+            phys = (sys_path / "device/phys").read_text().rstrip('\n')
+            identity = (name, phys)
+            handycon.logger.debug(f"Input device added: {name}, {phys}")
+        except OSError:
+            pass
+
+    for matches, future in waiters:
+        if not future.done() and (identity is None or identity in matches):
+            future.set_result(identity)
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# This file is part of Handheld Game Console Controller System (HandyGCCS)
+# Copyright 2022-2023 Derek J. Clark <derekjohn.clark@gmail.com>
+
+## Python Modules
+import time
+import traceback
+
+# Local modules
+from .constants import *
+from . import backend
+from . import hotplug
+
+handycon = None
+
+# The most recent scan, shared by every device lookup until an input node is added or removed.
+snapshot = None
+
+def set_handycon(handheld_controller):
+    global handycon
+    handycon = handheld_controller
+
+
+# A single scan of the input devices indexed for the device lookups.
+class Inventory:
+    def __init__(self, generation):
+        self.generation = generation
+        self.created = time.monotonic()
+        self.by_id = {}          # (name, phys): [path, ...]
+        self.by_capability = {}  # event type: {path, ...}
+        self.info = {}           # path: DeviceInfo
+
+    def add(self, path, name, phys, capabilities, info=None):
+        self.by_id.setdefault((name, phys), []).append(path)
+        for ev_type in capabilities:
+            self.by_capability.setdefault(ev_type, set()).add(path)
+        self.info[path] = info
+
+    # Returns the first path matching name and phys. If ev_type is given, nodes that
+    # don't report that event type are skipped.
+    def find(self, name, phys, ev_type=None):
+        for path in self.by_id.get((name, phys), ()):
+            if ev_type is None or path in self.find_capable(ev_type):
+                return path
+        return None
+
+    # Returns every path with the given phys, whatever the device is called.
+    def find_phys(self, phys):
+        return [path for (name, device_phys), paths in self.by_id.items() if device_phys == phys for path in paths]
+
+    def find_capable(self, ev_type):
+        return self.by_capability.get(ev_type, set())
+
+
+# Indexes every input device the backend lists.
+def scan():
+    inventory = Inventory(hotplug.generation)
+    for path, name, phys, capabilities, info in backend.current.list_devices():
+        inventory.add(path, name, phys, capabilities, info)
+        handycon.logger.debug(f"{name}, {phys}")
+    return inventory
+
+
+# Returns the shared snapshot, rescanning only if the set of input nodes has changed.
+def get_snapshot():
+    global snapshot
+
+    if snapshot is None or snapshot.generation != hotplug.generation:
+        snapshot = scan()
+
+    # Without a hotplug monitor we can't tell when the snapshot goes stale, so let it age out.
+    elif not hotplug.monitor_type and time.monotonic() - snapshot.created > DETECT_DELAY:
+        snapshot = scan()
+    return snapshot
+
+
+# Opens the device matching name and phys that reports ev_type. Returns None if it isn't present.
+def open_device(name, phys, ev_type=None):
+    global snapshot
+
+    path = get_snapshot().find(name, phys, ev_type)
+    if not path:
+        return None
+    try:
+        return backend.current.open(path)
+    except OSError:
+        handycon.logger.error(f"Unable to open {path}.")
+        handycon.logger.error(traceback.format_exc())
+        # Our snapshot is out of date, scan again next time.
+        snapshot = None
+        return None
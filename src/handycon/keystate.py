@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+# This file is part of Handheld Game Console Controller System (HandyGCCS)
+# Copyright 2022-2023 Derek J. Clark <derekjohn.clark@gmail.com>
+
+# Local modules
+from .constants import *
+
+handycon = None
+
+def set_handycon(handheld_controller):
+    global handycon
+    handycon = handheld_controller
+
+
+# Tracks the held keys of a device from its own EV_KEY stream so we don't need an
+# EVIOCGKEY ioctl (and a new list) for every event. The kernel state is only read when the
+# tracker is created and after a SYN_DROPPED, when events were lost and the stream can't
+# be trusted. If the device is filtered to codes, held keys outside of it are ignored
+# since we will never see them released.
+class KeyState:
+    def __init__(self, device, codes=None):
+        self.device = device
+        self.mask = -1        # Bitset of the keycodes we can see.
+        if codes is not None:
+            self.mask = 0
+            for code in codes:
+                self.mask |= 1 << code
+        self.keys = 0         # Bitset of held keycodes.
+        self.active = []      # Sorted held keycodes, rebuilt only when keys changes.
+        self.dropped = False
+        self.resync()
+
+    # Reads the held keys from the kernel.
+    def resync(self):
+        self.keys = 0
+        for code in self.device.active_keys():
+            self.keys |= 1 << code
+        self.keys &= self.mask
+        self.active = self.to_list()
+        self.dropped = False
+
+    # Applies an event and returns the sorted held keys. The list is shared between calls
+    # and must not be modified.
+    def update(self, event):
+        if event.type == e.EV_KEY:
+            # Events after a SYN_DROPPED are incomplete until the next SYN_REPORT.
+            if self.dropped:
+                return self.active
+            # Autorepeat (2) doesn't change anything.
+            if event.value == 1:
+                keys = self.keys | 1 << event.code
+            elif event.value == 0:
+                keys = self.keys & ~(1 << event.code)
+            else:
+                return self.active
+            if keys != self.keys:
+                self.keys = keys
+                self.active = self.to_list()
+
+        elif event.type == e.EV_SYN:
+            if event.code == e.SYN_DROPPED:
+                handycon.logger.debug(f"Dropped events from {self.device.name}. Resyncing key state.")
+                self.dropped = True
+            elif event.code == e.SYN_REPORT and self.dropped:
+                self.resync()
+        return self.active
+
+    def to_list(self):
+        active = []
+        keys = self.keys
+        while keys:
+            # Skip to the lowest set bit.
+            low = keys & -keys
+            active.append(low.bit_length() - 1)
+            keys ^= low
+        return active
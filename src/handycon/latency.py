@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# This file is part of Handheld Game Console Controller System (HandyGCCS)
+# Copyright 2022-2023 Derek J. Clark <derekjohn.clark@gmail.com>
+
+## Python Modules
+import fcntl
+import struct
+import time
+import traceback
+
+# Local modules
+from .constants import *
+
+handycon = None
+
+# _IOW('E', 0xa0, int)
+EVIOCSCLOCKID = 0x400445a0
+
+# Buckets are log-linear like an HDR histogram: every power of two is split into
+# SUB_BUCKETS linear buckets, so a recorded value is never off by more than 1/16 (~6%).
+SUB_BUCKET_BITS = 4
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+
+# Latencies are kept in microseconds and clamped to about 67 seconds.
+MAX_LATENCY = (1 << 26) - 1
+
+# Monotonic timestamps are seconds since boot. A device we couldn't switch over still
+# stamps events with CLOCK_REALTIME, which is always past this.
+REALTIME_THRESHOLD = 1000000000
+
+PERCENTILES = (50, 90, 99, 99.9)
+
+# "device" or "action": {name: Histogram}
+histograms = {"device": {}, "action": {}}
+
+def set_handycon(handheld_controller):
+    global handycon
+    handycon = handheld_controller
+
+
+# Returns the bucket index of a value.
+def bucket(value):
+    if value < SUB_BUCKETS * 2:
+        return value
+    shift = value.bit_length() - SUB_BUCKET_BITS - 1
+    return ((shift + 1) << SUB_BUCKET_BITS) + (value >> shift) - SUB_BUCKETS
+
+
+# Returns the largest value that falls in a bucket.
+def bucket_limit(index):
+    if index < SUB_BUCKETS * 2:
+        return index
+    shift = (index >> SUB_BUCKET_BITS) - 1
+    top = (index & (SUB_BUCKETS - 1)) + SUB_BUCKETS
+    return ((top + 1) << shift) - 1
+
+
+# Fixed size latency histogram. Recording is a few integer operations, so it stays on in
+# production.
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (bucket(MAX_LATENCY) + 1)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def record(self, value):
+        if value < 0:
+            value = 0
+        elif value > MAX_LATENCY:
+            value = MAX_LATENCY
+        self.counts[bucket(value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    # Returns the value at or below which percent of the recorded values fall.
+    def percentile(self, percent):
+        target = self.count * percent / 100
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= target:
+                return min(bucket_limit(index), self.max)
+        return self.max
+
+    def snapshot(self):
+        snapshot = {
+            "count": self.count,
+            "mean_us": round(self.total / self.count) if self.count else 0,
+            "max_us": self.max,
+            }
+        for percent in PERCENTILES:
+            snapshot[f"p{percent:g}_us"] = self.percentile(percent)
+        return snapshot
+
+
+# Makes the kernel stamp events read from device with CLOCK_MONOTONIC so latencies aren't
+# thrown off by NTP or the user changing the time.
+def set_clock(device):
+    try:
+        fcntl.ioctl(device.fd, EVIOCSCLOCKID, struct.pack("i", time.CLOCK_MONOTONIC))
+    except OSError as err:
+        handycon.logger.warn(f"{err} | Unable to set monotonic clock on {device.name}. Latency will use realtime timestamps.")
+        handycon.logger.debug(traceback.format_exc())
+        return False
+    return True
+
+
+# Microseconds from an event timestamp to now.
+def elapsed(sec, usec):
+    clock = time.CLOCK_MONOTONIC if sec < REALTIME_THRESHOLD else time.CLOCK_REALTIME
+    return time.clock_gettime_ns(clock) // 1000 - sec * 1000000 - usec
+
+
+# Records the latency of an event in the histogram for name. kind is "device" for
+# passthrough and "action" for mapped buttons.
+def record(kind, name, sec, usec):
+    # Events we build ourselves aren't stamped.
+    if not sec:
+        return
+    histogram = histograms[kind].get(name)
+    if histogram is None:
+        histogram = histograms[kind][name] = Histogram()
+    histogram.record(elapsed(sec, usec))
+
+
+def snapshot():
+    return {kind: {name: histogram.snapshot() for name, histogram in named.items()} for kind, named in histograms.items()}
+
+
+# Logs a line for every histogram. Called when the service stops.
+def report():
+    for kind, named in histograms.items():
+        for name, histogram in named.items():
+            stats = histogram.snapshot()
+            handycon.logger.info(f"Latency of {kind} {name}: {stats['count']} events, p50 {stats['p50_us']}us, p99 {stats['p99_us']}us, max {stats['max_us']}us.")
@@ -21,137 +21,183 @@
 # SOFTWARE.
 
 import os
-import ctypes
-import atexit
+import fcntl
+import select
 
 __all__ = ['HIDException', 'DeviceInfo', 'Device', 'enumerate']
 
 
-hidapi = None
-library_paths = (
-    'libhidapi-hidraw.so',
-    'libhidapi-hidraw.so.0',
-    'libhidapi-libusb.so',
-    'libhidapi-libusb.so.0',
-    'libhidapi-iohidmanager.so',
-    'libhidapi-iohidmanager.so.0',
-    'libhidapi.dylib',
-    'hidapi.dll',
-    'libhidapi-0.dll'
-)
-
-for lib in library_paths:
-    try:
-        hidapi = ctypes.cdll.LoadLibrary(lib)
-        break
-    except OSError:
-        pass
-else:
-    error = "Unable to load any of the following libraries:{}"\
-        .format(' '.join(library_paths))
-    raise ImportError(error)
+# hidraw through plain file I/O. Enumeration reads sysfs, feature and input reports use
+# the HIDIOC ioctls, so neither libhidapi nor ctypes is needed.
+SYS_HIDRAW_PATH = '/sys/class/hidraw'
+DEV_PATH = '/dev'
+
+# Largest report hidraw hands out.
+HID_MAX_BUFFER_SIZE = 4096
+
+_IOC_WRITE = 1
+_IOC_READ = 2
+
+
+def _IOC(direction, type, nr, size):
+    return (direction << 30) | (size << 16) | (ord(type) << 8) | nr
+
+
+def HIDIOCSFEATURE(size):
+    return _IOC(_IOC_WRITE | _IOC_READ, 'H', 0x06, size)
+
+
+def HIDIOCGFEATURE(size):
+    return _IOC(_IOC_WRITE | _IOC_READ, 'H', 0x07, size)
 
 
-hidapi.hid_init()
-atexit.register(hidapi.hid_exit)
+def HIDIOCGINPUT(size):
+    return _IOC(_IOC_WRITE | _IOC_READ, 'H', 0x0A, size)
 
 
 class HIDException(Exception):
     pass
 
 
-class DeviceInfo(ctypes.Structure):
+class DeviceInfo(dict):
     def as_dict(self):
-        ret = {}
-        for name, type in self._fields_:
-            if name == 'next':
-                continue
-            ret[name] = getattr(self, name, None)
+        return dict(self)
 
-        return ret
 
-DeviceInfo._fields_ = [
-    ('path', ctypes.c_char_p),
-    ('vendor_id', ctypes.c_ushort),
-    ('product_id', ctypes.c_ushort),
-    ('serial_number', ctypes.c_wchar_p),
-    ('release_number', ctypes.c_ushort),
-    ('manufacturer_string', ctypes.c_wchar_p),
-    ('product_string', ctypes.c_wchar_p),
-    ('usage_page', ctypes.c_ushort),
-    ('usage', ctypes.c_ushort),
-    ('interface_number', ctypes.c_int),
-    ('next', ctypes.POINTER(DeviceInfo)),
-]
-
-hidapi.hid_init.argtypes = []
-hidapi.hid_init.restype = ctypes.c_int
-hidapi.hid_exit.argtypes = []
-hidapi.hid_exit.restype = ctypes.c_int
-hidapi.hid_enumerate.argtypes = [ctypes.c_ushort, ctypes.c_ushort]
-hidapi.hid_enumerate.restype = ctypes.POINTER(DeviceInfo)
-hidapi.hid_free_enumeration.argtypes = [ctypes.POINTER(DeviceInfo)]
-hidapi.hid_free_enumeration.restype = None
-hidapi.hid_open.argtypes = [ctypes.c_ushort, ctypes.c_ushort, ctypes.c_wchar_p]
-hidapi.hid_open.restype = ctypes.c_void_p
-hidapi.hid_open_path.argtypes = [ctypes.c_char_p]
-hidapi.hid_open_path.restype = ctypes.c_void_p
-hidapi.hid_write.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_size_t]
-hidapi.hid_write.restype = ctypes.c_int
-hidapi.hid_read_timeout.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_size_t, ctypes.c_int]
-hidapi.hid_read_timeout.restype = ctypes.c_int
-hidapi.hid_read.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_size_t]
-hidapi.hid_read.restype = ctypes.c_int
-hidapi.hid_get_input_report.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_size_t]
-hidapi.hid_get_input_report.restype = ctypes.c_int
-hidapi.hid_set_nonblocking.argtypes = [ctypes.c_void_p, ctypes.c_int]
-hidapi.hid_set_nonblocking.restype = ctypes.c_int
-hidapi.hid_send_feature_report.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_int]
-hidapi.hid_send_feature_report.restype = ctypes.c_int
-hidapi.hid_get_feature_report.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_size_t]
-hidapi.hid_get_feature_report.restype = ctypes.c_int
-hidapi.hid_close.argtypes = [ctypes.c_void_p]
-hidapi.hid_close.restype = None
-hidapi.hid_get_manufacturer_string.argtypes = [ctypes.c_void_p, ctypes.c_wchar_p, ctypes.c_size_t]
-hidapi.hid_get_manufacturer_string.restype = ctypes.c_int
-hidapi.hid_get_product_string.argtypes = [ctypes.c_void_p, ctypes.c_wchar_p, ctypes.c_size_t]
-hidapi.hid_get_product_string.restype = ctypes.c_int
-hidapi.hid_get_serial_number_string.argtypes = [ctypes.c_void_p, ctypes.c_wchar_p, ctypes.c_size_t]
-hidapi.hid_get_serial_number_string.restype = ctypes.c_int
-hidapi.hid_get_indexed_string.argtypes = [ctypes.c_void_p, ctypes.c_int, ctypes.c_wchar_p, ctypes.c_size_t]
-hidapi.hid_get_indexed_string.restype = ctypes.c_int
-hidapi.hid_error.argtypes = [ctypes.c_void_p]
-hidapi.hid_error.restype = ctypes.c_wchar_p
+def _read_attribute(path, default=None):
+    try:
+        with open(path, 'r') as attribute:
+            return attribute.read().strip()
+    except OSError:
+        return default
 
 
-def enumerate(vid=0, pid=0):
+def _read_uevent(path):
+    ret = {}
+    for line in (_read_attribute(path, '') or '').splitlines():
+        key, sep, value = line.partition('=')
+        if sep:
+            ret[key] = value
+    return ret
+
+
+def _collections(descriptor):
+    """
+    Find the top level application collections of a report descriptor.
+
+    :param descriptor: bytes - The raw report descriptor
+    :return: list - (usage_page, usage) of every top level collection
+    """
     ret = []
-    info = hidapi.hid_enumerate(vid, pid)
-    c = info
+    usage_page = 0
+    usage = 0
+    depth = 0
+    i = 0
+    while i < len(descriptor):
+        prefix = descriptor[i]
+        if prefix == 0xFE:
+            # Long item, skip it.
+            if i + 1 >= len(descriptor):
+                break
+            i += 3 + descriptor[i + 1]
+            continue
+
+        size = (0, 1, 2, 4)[prefix & 0x03]
+        value = int.from_bytes(descriptor[i + 1:i + 1 + size], 'little')
+        i += 1 + size
+        match prefix & 0xFC:
+            case 0x04:  # Usage Page
+                usage_page = value
+            case 0x08:  # Usage
+                if size == 4:
+                    usage_page = value >> 16
+                usage = value & 0xFFFF
+            case 0xA0:  # Collection
+                if depth == 0:
+                    ret.append((usage_page, usage))
+                depth += 1
+            case 0xC0:  # End Collection
+                depth = max(depth - 1, 0)
+    return ret
+
+
+def _device_infos(hidraw):
+    device_path = os.path.join(SYS_HIDRAW_PATH, hidraw, 'device')
+    uevent = _read_uevent(os.path.join(device_path, 'uevent'))
+    try:
+        bus, vendor_id, product_id = (int(field, 16) for field in uevent['HID_ID'].split(':'))
+    except (KeyError, ValueError):
+        return []
+
+    # The USB interface and device above the HID device, if this is USB at all.
+    hid_path = os.path.realpath(device_path)
+    interface_path = os.path.dirname(hid_path)
+    usb_path = os.path.dirname(interface_path)
+    interface_number = _read_attribute(os.path.join(interface_path, 'bInterfaceNumber'))
+    release_number = _read_attribute(os.path.join(usb_path, 'bcdDevice'))
+
+    try:
+        with open(os.path.join(device_path, 'report_descriptor'), 'rb') as report_descriptor:
+            collections = _collections(report_descriptor.read())
+    except OSError:
+        collections = []
 
-    while c:
-        ret.append(c.contents.as_dict())
-        c = c.contents.next
+    info = {
+        'path': os.path.join(DEV_PATH, hidraw).encode(),
+        'vendor_id': vendor_id,
+        'product_id': product_id,
+        'serial_number': uevent.get('HID_UNIQ', ''),
+        'release_number': int(release_number, 16) if release_number else 0,
+        'manufacturer_string': _read_attribute(os.path.join(usb_path, 'manufacturer'), ''),
+        'product_string': _read_attribute(os.path.join(usb_path, 'product'), uevent.get('HID_NAME', '')),
+        'interface_number': int(interface_number, 16) if interface_number else -1,
+    }
 
-    hidapi.hid_free_enumeration(info)
+    # One entry per top level collection, like hidapi does.
+    return [DeviceInfo(info, usage_page=usage_page, usage=usage) for usage_page, usage in collections or [(0, 0)]]
+
+
+def enumerate(vid=0, pid=0):
+    ret = []
+    try:
+        hidraws = sorted(os.listdir(SYS_HIDRAW_PATH))
+    except OSError:
+        return ret
+
+    for hidraw in hidraws:
+        for info in _device_infos(hidraw):
+            if vid and info['vendor_id'] != vid:
+                continue
+            if pid and info['product_id'] != pid:
+                continue
+            ret.append(info)
 
     return ret
 
 
 class Device(object):
     def __init__(self, vid=None, pid=None, serial=None, path=None):
-        if path:
-            self.__dev = hidapi.hid_open_path(path)
-        elif serial:
-            serial = ctypes.create_unicode_buffer(serial)
-            self.__dev = hidapi.hid_open(vid, pid, serial)
-        elif vid and pid:
-            self.__dev = hidapi.hid_open(vid, pid, None)
-        else:
-            raise ValueError('specify vid/pid or path')
-
-        if not self.__dev:
-            raise HIDException('unable to open device')
+        if not path:
+            if not (vid and pid):
+                raise ValueError('specify vid/pid or path')
+            for info in enumerate(vid, pid):
+                if not serial or info['serial_number'] == serial:
+                    path = info['path']
+                    break
+            else:
+                raise HIDException('unable to open device')
+
+        if isinstance(path, bytes):
+            path = path.decode()
+        self.path = path
+        try:
+            self.__fd = os.open(path, os.O_RDWR | os.O_CLOEXEC)
+        except OSError as err:
+            raise HIDException(f'unable to open device: {err}')
+
+        # Reused by every read so a report costs a single allocation.
+        self.__buffer = bytearray(HID_MAX_BUFFER_SIZE)
+        self.__view = memoryview(self.__buffer)
 
     def __enter__(self):
         return self
@@ -159,64 +205,81 @@ class Device(object):
     def __exit__(self, exc_type, exc_value, exc_traceback):
         self.close()
 
-    def __hidcall(self, function, *args, **kwargs):
-        if not self.__dev:
+    @property
+    def fd(self):
+        if self.__fd is None:
             raise HIDException('device closed')
+        return self.__fd
 
-        ret = function(*args, **kwargs)
-
-        if ret == -1:
-            err = hidapi.hid_error(self.__dev)
-            raise HIDException(err)
-        return ret
+    def __ioctl(self, request, data):
+        try:
+            return fcntl.ioctl(self.fd, request, data, True)
+        except OSError as err:
+            raise HIDException(str(err))
 
-    def __readstring(self, function, max_length=255):
-        buf = ctypes.create_unicode_buffer(max_length)
-        self.__hidcall(function, self.__dev, buf, max_length)
-        return buf.value
+    def __info(self):
+        hidraw = os.path.basename(self.path)
+        infos = _device_infos(hidraw)
+        if not infos:
+            raise HIDException(f'no device information for {hidraw}')
+        return infos[0]
 
     def write(self, data):
-        return self.__hidcall(hidapi.hid_write, self.__dev, data, len(data))
+        try:
+            return os.write(self.fd, data)
+        except OSError as err:
+            raise HIDException(str(err))
+
+    def read_into(self, buffer, timeout=None):
+        """
+        Read one report into buffer without allocating.
+
+        :param buffer: bytearray or memoryview - Where to put the report
+        :param timeout: int - Milliseconds to wait, None to honour nonblocking
+        :return: int - The report length, 0 if there was none
+        """
+        if timeout is not None:
+            poll = select.poll()
+            poll.register(self.fd, select.POLLIN)
+            if not poll.poll(timeout):
+                return 0
+
+        try:
+            return os.readv(self.fd, (buffer,))
+        except BlockingIOError:
+            return 0
+        except OSError as err:
+            raise HIDException(str(err))
 
     def read(self, size, timeout=None):
-        data = ctypes.create_string_buffer(size)
-
-        if timeout is None:
-            size = self.__hidcall(hidapi.hid_read, self.__dev, data, size)
-        else:
-            size = self.__hidcall(
-                hidapi.hid_read_timeout, self.__dev, data, size, timeout)
-
-        return data.raw[:size]
+        size = self.read_into(self.__view[:size], timeout)
+        return bytes(self.__view[:size])
 
     def get_input_report(self, report_id, size):
-        data = ctypes.create_string_buffer(size)
+        data = bytearray(size)
 
         # Pass the id of the report to be read.
-        data[0] = bytearray((report_id,))
+        data[0] = report_id
 
-        size = self.__hidcall(
-            hidapi.hid_get_input_report, self.__dev, data, size)
-        return data.raw[:size]
+        size = self.__ioctl(HIDIOCGINPUT(size), data)
+        return bytes(data[:size])
 
     def send_feature_report(self, data):
-        return self.__hidcall(hidapi.hid_send_feature_report,
-                              self.__dev, data, len(data))
+        return self.__ioctl(HIDIOCSFEATURE(len(data)), bytearray(data))
 
     def get_feature_report(self, report_id, size):
-        data = ctypes.create_string_buffer(size)
+        data = bytearray(size)
 
         # Pass the id of the report to be read.
-        data[0] = bytearray((report_id,))
+        data[0] = report_id
 
-        size = self.__hidcall(
-            hidapi.hid_get_feature_report, self.__dev, data, size)
-        return data.raw[:size]
+        size = self.__ioctl(HIDIOCGFEATURE(size), data)
+        return bytes(data[:size])
 
     def close(self):
-        if self.__dev:
-            hidapi.hid_close(self.__dev)
-            self.__dev = None
+        if self.__fd is not None:
+            os.close(self.__fd)
+            self.__fd = None
 
     @property
     def nonblocking(self):
@@ -224,28 +287,28 @@ class Device(object):
 
     @nonblocking.setter
     def nonblocking(self, value):
-        self.__hidcall(hidapi.hid_set_nonblocking, self.__dev, value)
+        os.set_blocking(self.fd, not value)
         setattr(self, '_nonblocking', value)
 
     @property
     def manufacturer(self):
-        return self.__readstring(hidapi.hid_get_manufacturer_string)
+        return self.__info()['manufacturer_string']
 
     @property
     def product(self):
-        return self.__readstring(hidapi.hid_get_product_string)
+        return self.__info()['product_string']
 
     @property
     def serial(self):
-        return self.__readstring(hidapi.hid_get_serial_number_string)
+        return self.__info()['serial_number']
 
     def get_indexed_string(self, index, max_length=255):
-        buf = ctypes.create_unicode_buffer(max_length)
-        self.__hidcall(hidapi.hid_get_indexed_string,
-                       self.__dev, index, buf, max_length)
-        return buf.value
+        # hidraw has no way to read arbitrary string descriptors.
+        raise HIDException('get_indexed_string is not supported on hidraw')
 
 
+import json
+import logging
 import time
 from enum import Enum
 # Global variables
@@ -253,6 +316,15 @@ vendor_id = 0x17EF
 product_id_match = lambda x: x & 0xFFF0 == 0x6180
 usage_page = 0xFFA0
 global_config = None  # Global configuration for the device
+logger = logging.getLogger(__name__)
+
+# Seconds between two commands of a burst. The controller drops commands sent back to back.
+COMMAND_DELAY = 0.05
+
+# The last command the controller accepted for every setting, see command_key. Used to
+# roll back a burst that failed halfway. Sessions with a state_path persist it, so it
+# survives restarts. Settings never sent through a session have no entry.
+known_good = {}
 
 class Gyro(Enum):
     LEFT_GYRO = 0x01
@@ -265,23 +337,168 @@ class GyroRemapActions(Enum):
 
 def get_config():
     # Enumerate and set the global configuration
+    global global_config
     config = None
     for dev in enumerate(vendor_id):
         if product_id_match(dev["product_id"]) and dev["usage_page"] == usage_page:
-            global_config = dev
             config = dev
             break
+    global_config = config
     return config
 
 
+def command_key(command):
+    """
+    Identify the setting a command changes, so a later command for the same setting
+    replaces it.
+
+    :param command: bytes - A 64 byte command from one of the create_*_command functions
+    :return: bytes - The command byte and the parameters that select the setting
+    """
+    match command[2]:
+        case 0x6a:
+            # Gyro remap: sub-parameters and gyro.
+            length = 7
+        case 0x6c if command[3] == 0x04:
+            # FPS remap: controller, profile and button.
+            length = 7
+        case 0x6c:
+            # Button remap: controller and button.
+            length = 6
+        case _:
+            # Touchpad, RGB, vibration: sub-parameter and controller.
+            length = 5
+    return bytes(command[2:length])
+
+
+class CommandSession(object):
+    """
+    Send a batch of commands over a single open handle.
+
+    Commands are queued and sent in one paced burst by commit(). If a write fails, every
+    setting the burst already changed is restored from known_good and HIDException is
+    raised. With state_path, known_good is loaded from that file before the burst and
+    saved back after it, so a burst can be rolled back to what an earlier run sent. Used
+    as a context manager the batch is committed on exit unless the block raised.
+    """
+    def __init__(self, path=None, delay=COMMAND_DELAY, state_path=None):
+        self.path = path
+        self.delay = delay
+        self.state_path = state_path
+        self.commands = {}  # command_key: command, last queued wins.
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.commands.clear()
+
+    def __len__(self):
+        return len(self.commands)
+
+    def queue(self, command):
+        assert len(command) == 64
+        self.commands[command_key(command)] = bytes(command)
+
+    def __rollback(self, device, applied):
+        for key in reversed(applied):
+            command = known_good.get(key)
+            if not command:
+                logger.warning(f"No known good state for setting {key.hex()}. Leaving it as is.")
+                continue
+            try:
+                device.write(command)
+            except HIDException as err:
+                logger.error(f"{err} | Unable to restore setting {key.hex()}.")
+            time.sleep(self.delay)
+
+    def commit(self):
+        """
+        Send every queued command.
+
+        :return: int - The number of commands sent
+        """
+        if not self.commands:
+            return 0
+
+        path = self.path
+        if not path:
+            config = global_config or get_config()
+            if not config:
+                raise HIDException('no Legion controller found')
+            path = config['path']
+
+        if self.state_path:
+            load_known_good(self.state_path)
+
+        commands, self.commands = self.commands, {}
+        applied = []
+        with Device(path=path) as device:
+            for key, command in commands.items():
+                if applied:
+                    time.sleep(self.delay)
+                try:
+                    device.write(command)
+                except HIDException as err:
+                    logger.error(f"{err} | Command {command[:8].hex()} failed. Rolling back {len(applied)} commands.")
+                    self.__rollback(device, applied)
+                    raise
+                applied.append(key)
+
+        for key in applied:
+            known_good[key] = commands[key]
+        if self.state_path:
+            save_known_good(self.state_path)
+        logger.debug(f"Sent {len(applied)} commands to {path}.")
+        return len(applied)
+
+
+def load_known_good(path):
+    """
+    Add the settings saved in path to known_good. Settings sent since this process
+    started are newer and kept.
+
+    :param path: str - JSON file written by save_known_good
+    """
+    try:
+        with open(path, 'r') as state_file:
+            saved = json.load(state_file)
+    except FileNotFoundError:
+        return
+    except (OSError, ValueError) as err:
+        logger.warning(f"{err} | Unable to read {path}. Nothing from earlier runs can be rolled back to.")
+        return
+    for key, command in saved.items():
+        known_good.setdefault(bytes.fromhex(key), bytes.fromhex(command))
+
+
+def save_known_good(path):
+    """
+    Write known_good to path, replacing it atomically.
+
+    :param path: str - Where to keep the state
+    """
+    temp_path = f'{path}.tmp'
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(temp_path, 'w') as state_file:
+            json.dump({key.hex(): command.hex() for key, command in known_good.items()}, state_file)
+        os.replace(temp_path, path)
+    except OSError as err:
+        logger.warning(f"{err} | Unable to save {path}. Only this run can be rolled back to.")
+
+
 def send_command(command):
-    assert len(command) == 64 and global_config
     try:
-        with Device(path=global_config['path']) as device:
-            device.write(command)
-            print("Command sent successfully.")
-    except IOError as e:
-        print(f"Error opening HID device: {e}")
+        with CommandSession() as session:
+            session.queue(command)
+    except HIDException as e:
+        logger.error(f"Error sending command to HID device: {e}")
+        return False
+    return True
 
 
 def create_touchpad_command(enable):
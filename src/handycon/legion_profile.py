@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# This file is part of Handheld Game Console Controller System (HandyGCCS)
+# Copyright 2022-2023 Derek J. Clark <derekjohn.clark@gmail.com>
+#
+# Applies the [Legion Profile] section of the config to the Legion Go controllers. Every
+# setting is optional, leave one out and the controller keeps whatever it has:
+#
+#   [Legion Profile]
+#   rgb = on                  # on, off
+#   rgb_mode = solid          # solid, blinking, or a mode number
+#   rgb_color = ff0000
+#   rgb_brightness = 64       # 0-100
+#   rgb_speed = 50            # 0-100, higher is slower
+#   y1 = a                    # back buttons y1, y2, y3, m2, m3, see REMAP_ACTIONS
+#   left_gyro = disabled      # left_gyro, right_gyro: disabled, left_joystick, right_joystick
+#   vibration = medium        # off, weak, medium, strong
+#   touchpad = on             # on, off
+#
+# The controllers keep these in flash, so only the settings that changed since the last
+# apply are sent. The hash of every applied setting is cached in LEGION_PROFILE_CACHE.
+
+## Python Modules
+import asyncio
+import hashlib
+import json
+import os
+import traceback
+
+# Local modules
+from .constants import *
+
+handycon = None
+
+SECTION = "Legion Profile"
+LEFT_CONTROLLER = 0x03
+RIGHT_CONTROLLER = 0x04
+CONTROLLERS = (LEFT_CONTROLLER, RIGHT_CONTROLLER)
+
+SWITCHES = {"on": True, "off": False}
+RGB_MODES = {"solid": 0x01, "blinking": 0x02}
+VIBRATION_LEVELS = {"off": 0x00, "weak": 0x01, "medium": 0x02, "strong": 0x03}
+
+# Back button: (controller, button code).
+REMAP_BUTTONS = {
+        "y1": (LEFT_CONTROLLER, 0x1c),
+        "y2": (LEFT_CONTROLLER, 0x1d),
+        "y3": (RIGHT_CONTROLLER, 0x1e),
+        "m2": (RIGHT_CONTROLLER, 0x21),
+        "m3": (RIGHT_CONTROLLER, 0x22),
+        }
+
+# See create_button_remap_command.
+REMAP_ACTIONS = {
+        "disabled": 0x00,
+        "ls_click": 0x03, "ls_up": 0x04, "ls_down": 0x05, "ls_left": 0x06, "ls_right": 0x07,
+        "rs_click": 0x08, "rs_up": 0x09, "rs_down": 0x0a, "rs_left": 0x0b, "rs_right": 0x0c,
+        "dpad_up": 0x0d, "dpad_down": 0x0e, "dpad_left": 0x0f, "dpad_right": 0x10,
+        "a": 0x12, "b": 0x13, "x": 0x14, "y": 0x15,
+        "lb": 0x16, "lt": 0x17, "rb": 0x18, "rt": 0x19,
+        "view": 0x23, "menu": 0x24,
+        }
+
+# See legion_configurator.Gyro and GyroRemapActions. Kept here so the configurator is
+# only imported when a profile is applied.
+GYRO_ACTIONS = {"disabled": 0x00, "left_joystick": 0x01, "right_joystick": 0x02}
+
+GYROS = {
+        "left_gyro": 0x01,
+        "right_gyro": 0x02,
+        }
+
+def set_handycon(handheld_controller):
+    global handycon
+    handycon = handheld_controller
+
+
+def lookup(choices, setting, value):
+    try:
+        return choices[value.lower()]
+    except KeyError:
+        raise ValueError(f"{setting} must be one of {', '.join(choices)}, not {value}.")
+
+
+def percent(setting, value):
+    value = int(value)
+    if not 0 <= value <= 100:
+        raise ValueError(f"{setting} must be between 0 and 100, not {value}.")
+    return value
+
+
+def rgb_commands(profile):
+    from . import legion_configurator as lc
+
+    if not lookup(SWITCHES, "rgb", profile.get("rgb", "on")):
+        return [lc.create_rgb_on_off_command(controller, False) for controller in CONTROLLERS]
+
+    # An empty value is the same as leaving it out.
+    mode = profile.get("rgb_mode") or "solid"
+    mode = int(mode, 0) if mode[:1].isdigit() else lookup(RGB_MODES, "rgb_mode", mode)
+    color = bytes.fromhex(profile.get("rgb_color", "ffffff").lstrip("#"))
+    if len(color) != 3:
+        raise ValueError(f"rgb_color must be six hex digits, not {profile['rgb_color']}.")
+    brightness = percent("rgb_brightness", profile.get("rgb_brightness", "100"))
+    speed = percent("rgb_speed", profile.get("rgb_speed", "50"))
+
+    commands = []
+    for controller in CONTROLLERS:
+        commands.append(lc.create_rgb_control_command(controller, mode, color, brightness, speed))
+        commands.append(lc.create_rgb_on_off_command(controller, True))
+    return commands
+
+
+# Builds the commands of every setting the profile has. Returns {setting: [command, ...]}.
+# Settings with bad values are left out.
+def build_commands(profile):
+    from . import legion_configurator as lc
+
+    settings = {}
+    builders = {}
+    if any(key.startswith("rgb") for key in profile):
+        builders["rgb"] = lambda: rgb_commands(profile)
+    for button, (controller, code) in REMAP_BUTTONS.items():
+        if button in profile:
+            builders[button] = lambda controller=controller, code=code, button=button: [
+                    lc.create_button_remap_command(controller, code, lookup(REMAP_ACTIONS, button, profile[button]))]
+    for name, gyro in GYROS.items():
+        if name in profile:
+            builders[name] = lambda gyro=gyro, name=name: [
+                    lc.create_gyro_remap_command(gyro, lookup(GYRO_ACTIONS, name, profile[name]))]
+    if "vibration" in profile:
+        builders["vibration"] = lambda: [
+                lc.create_vibration_command(controller, lookup(VIBRATION_LEVELS, "vibration", profile["vibration"])) for controller in CONTROLLERS]
+    if "touchpad" in profile:
+        builders["touchpad"] = lambda: [lc.create_touchpad_command(lookup(SWITCHES, "touchpad", profile["touchpad"]))]
+
+    for setting, build in builders.items():
+        try:
+            settings[setting] = build()
+        except ValueError as err:
+            handycon.logger.warn(f"{err} | Ignoring [{SECTION}] {setting}.")
+    return settings
+
+
+def hash_commands(commands):
+    return hashlib.sha256(b"".join(commands)).hexdigest()
+
+
+def load_cache():
+    try:
+        with open(LEGION_PROFILE_CACHE, "r") as cache_file:
+            return json.load(cache_file)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_cache(cache):
+    try:
+        LEGION_PROFILE_CACHE.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = LEGION_PROFILE_CACHE.with_suffix(".tmp")
+        with open(temp_path, "w") as cache_file:
+            json.dump(cache, cache_file)
+        os.replace(temp_path, LEGION_PROFILE_CACHE)
+    except OSError as err:
+        handycon.logger.warn(f"{err} | Unable to save {LEGION_PROFILE_CACHE}. The profile will be sent again next time.")
+
+
+# Sends the settings that differ from the last applied state of the controller at
+# config["path"]. config is what legion_configurator.get_config returned.
+async def apply(config):
+    global handycon
+
+    if not handycon.config.has_section(SECTION):
+        return
+    from . import legion_configurator as lc
+    settings = build_commands(handycon.config[SECTION])
+
+    # Controllers are told apart by serial, the path changes on every reattach.
+    device_key = config.get("serial_number") or "default"
+    cache = load_cache()
+    applied = cache.setdefault(device_key, {})
+    changed = {setting: commands for setting, commands in settings.items() if applied.get(setting) != hash_commands(commands)}
+    if not changed:
+        handycon.logger.debug("Legion profile is up to date.")
+        return
+
+    session = lc.CommandSession(path=config["path"], state_path=LEGION_KNOWN_GOOD)
+    for commands in changed.values():
+        for command in commands:
+            session.queue(command)
+    try:
+        # Commands are paced, keep the sleeps off the event loop.
+        await asyncio.to_thread(session.commit)
+    except lc.HIDException as err:
+        handycon.logger.error(f"{err} | Unable to apply the Legion profile.")
+        handycon.logger.error(traceback.format_exc())
+        return
+
+    for setting, commands in changed.items():
+        applied[setting] = hash_commands(commands)
+    save_cache(cache)
+    handycon.logger.info(f"Applied Legion profile settings: {', '.join(changed)}.")
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# This file is part of Handheld Game Console Controller System (HandyGCCS)
+# Copyright 2022-2023 Derek J. Clark <derekjohn.clark@gmail.com>
+
+## Python Modules
+import asyncio
+import json
+import os
+import time
+import traceback
+
+# Local modules
+from .constants import *
+from . import latency
+from . import reactor
+
+## Partial imports
+from collections import Counter
+
+handycon = None
+
+# (metric, device): count. Bumped inline on the hot paths, so keep it to a dict update.
+counters = Counter()
+
+# How often the event loop lag is sampled, in seconds.
+LAG_INTERVAL = 1.0
+lag = latency.Histogram()
+
+started = time.monotonic()
+
+def set_handycon(handheld_controller):
+    global handycon
+    handycon = handheld_controller
+
+
+# Samples how late the event loop wakes up a sleeping task. Anything blocking the loop
+# delays every device by the same amount.
+async def measure_lag():
+    loop = asyncio.get_running_loop()
+    while handycon.running:
+        start = loop.time()
+        await asyncio.sleep(LAG_INTERVAL)
+        lag.record(int((loop.time() - start - LAG_INTERVAL) * 1000000))
+
+
+# Per device totals. Reactor counts survive reconnects. connects is how many times the
+# device has been watched, so anything above 1 is a reconnect.
+def device_stats():
+    stats = {}
+    for name, total in reactor.totals.items():
+        stats[name] = {"connects": total["watches"], "wakeups": total["wakeups"], "events": total["events"]}
+    for watch in reactor.watches.values():
+        stats[watch.name]["wakeups"] += watch.wakeups
+        stats[watch.name]["events"] += watch.events
+    for (metric, device), count in counters.items():
+        stats.setdefault(device, {})[metric] = count
+    return stats
+
+
+def snapshot():
+    return {
+        "system_type": handycon.system_type,
+        "power_action": handycon.power_action,
+        "performance_mode": handycon.performance_mode,
+        "uptime_s": round(time.monotonic() - started, 3),
+        "devices": device_stats(),
+        "loop_lag": lag.snapshot(),
+        "latency": latency.snapshot(),
+        }
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels.items()) + "}"
+
+
+# Writes a histogram as a Prometheus summary.
+def format_summary(lines, name, labels, histogram):
+    for percent in latency.PERCENTILES:
+        quantile = format_labels({**labels, "quantile": f"{percent / 100:g}"})
+        lines.append(f"{name}{quantile} {histogram.percentile(percent)}")
+    labels = format_labels(labels)
+    lines.append(f"{name}_sum{labels} {histogram.total}")
+    lines.append(f"{name}_count{labels} {histogram.count}")
+
+
+# Prometheus text exposition format.
+def format_prometheus():
+    lines = []
+    info = format_labels({"system_type": handycon.system_type, "power_action": handycon.power_action, "performance_mode": handycon.performance_mode})
+    lines.append("# TYPE handygccs_info gauge")
+    lines.append(f"handygccs_info{info} 1")
+    lines.append("# TYPE handygccs_uptime_seconds gauge")
+    lines.append(f"handygccs_uptime_seconds {time.monotonic() - started:.3f}")
+
+    by_metric = {}
+    for device, stats in device_stats().items():
+        for metric, count in stats.items():
+            by_metric.setdefault(metric, []).append(f'handygccs_{metric}_total{{device="{device}"}} {count}')
+    for metric, samples in sorted(by_metric.items()):
+        lines.append(f"# TYPE handygccs_{metric}_total counter")
+        lines.extend(samples)
+
+    lines.append("# TYPE handygccs_loop_lag_microseconds summary")
+    format_summary(lines, "handygccs_loop_lag_microseconds", {}, lag)
+    lines.append("# TYPE handygccs_latency_microseconds summary")
+    for kind, named in latency.histograms.items():
+        for name, histogram in named.items():
+            format_summary(lines, "handygccs_latency_microseconds", {"kind": kind, "name": name}, histogram)
+    return "\n".join(lines) + "\n"
+
+
+# Answers one request per connection. The client sends "json" (the default) or
+# "prometheus" on a line and gets the snapshot back before the socket is closed.
+async def handle_client(reader, writer):
+    try:
+        request = await asyncio.wait_for(reader.readline(), 1.0)
+        match request.decode().strip().lower():
+            case "" | "json":
+                response = json.dumps(snapshot()) + "\n"
+            case "prometheus":
+                response = format_prometheus()
+            case command:
+                response = json.dumps({"error": f"Unknown command {command}."}) + "\n"
+        writer.write(response.encode())
+        await writer.drain()
+    except Exception as err:
+        handycon.logger.warn(f"{err} | Error answering metrics request.")
+        handycon.logger.debug(traceback.format_exc())
+    finally:
+        writer.close()
+
+
+# Serves snapshots on METRICS_PATH until the service stops.
+async def serve():
+    try:
+        METRICS_PATH.parent.mkdir(parents=True, exist_ok=True)
+        METRICS_PATH.unlink(missing_ok=True)
+        server = await asyncio.start_unix_server(handle_client, path=str(METRICS_PATH))
+        os.chmod(METRICS_PATH, 0o660)
+    except OSError as err:
+        handycon.logger.error(f"{err} | Unable to open metrics socket {METRICS_PATH}.")
+        handycon.logger.error(traceback.format_exc())
+        return
+
+    handycon.logger.info(f"Serving metrics on {METRICS_PATH}.")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        METRICS_PATH.unlink(missing_ok=True)
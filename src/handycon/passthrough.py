@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# This file is part of Handheld Game Console Controller System (HandyGCCS)
+# Copyright 2022-2023 Derek J. Clark <derekjohn.clark@gmail.com>
+
+## Python Modules
+import os
+import struct
+
+# Local modules
+from .constants import *
+from . import latency
+from . import metrics
+from . import reactor
+from . import recording
+
+# struct input_event: struct timeval, __u16 type, __u16 code, __s32 value.
+EVENT_FORMAT = "llHHi"
+EVENT_SIZE = struct.calcsize(EVENT_FORMAT)
+TYPE_OFFSET = struct.calcsize("ll")
+TYPE_CODE = struct.Struct("HH")
+TIME = struct.Struct("ll")
+
+# Events read per syscall. A gamepad frame is rarely more than a dozen events.
+EVENT_BATCH = 64
+
+# Event types that must not be forwarded. Passing EV_FF/EV_UINPUT back to the virtual
+# device feeds rumble into itself.
+BLOCKED_TYPES = frozenset([e.EV_FF, e.EV_UINPUT])
+
+# Copies events from a grabbed device to a uinput device without decoding them into
+# InputEvent objects. Reads go straight into a preallocated buffer of struct input_event,
+# blocked events are squeezed out in place and every complete SYN_REPORT frame in the
+# buffer goes out in a single write(). If name is set the latency of the last SYN_REPORT
+# of every write and the event counts are recorded under it.
+class Forwarder:
+    def __init__(self, in_fd, out_fd, name=None):
+        self.in_fd = in_fd
+        self.out_fd = out_fd
+        self.name = name
+        self.buffer = bytearray(EVENT_SIZE * EVENT_BATCH)
+        self.view = memoryview(self.buffer)
+        self.used = 0          # Bytes of the current partial frame held at the buffer start.
+        self.dropped = False   # Discarding events until the next SYN_REPORT.
+
+    # Reads whatever is available and forwards the complete frames. Returns the number of
+    # bytes written.
+    def forward(self):
+        written = 0
+        while True:
+            space = len(self.buffer) - self.used
+            try:
+                count = os.readv(self.in_fd, [self.view[self.used:]])
+            except BlockingIOError:
+                return written
+            if count == 0:
+                raise OSError(f"End of file reading fd {self.in_fd}.")
+            if recording.recorder and self.name:
+                recording.recorder.write(self.name, recording.GAMEPAD, self.view[self.used:self.used + count])
+
+            end = self.filter(self.used, self.used + count)
+            if end:
+                written += os.write(self.out_fd, self.view[:end])
+                if self.name:
+                    latency.record("device", self.name, *TIME.unpack_from(self.buffer, end - EVENT_SIZE))
+            if self.name:
+                metrics.counters[("events_in", self.name)] += count // EVENT_SIZE
+                metrics.counters[("events_out", self.name)] += end // EVENT_SIZE
+
+            # Keep the unfinished frame for the next read.
+            if end < self.used:
+                self.buffer[:self.used - end] = self.buffer[end:self.used]
+            self.used -= end
+
+            # A full buffer without a SYN_REPORT can't be a frame we understand.
+            if self.used == len(self.buffer):
+                self.used = 0
+
+            # A short read means the kernel buffer is empty.
+            if count < space:
+                return written
+
+    # Compacts the events between start and stop, dropping blocked ones, and returns the
+    # end offset of the last complete frame. self.used is set to the end of the kept data.
+    def filter(self, start, stop):
+        buffer = self.buffer
+        keep = start
+        frame_end = 0
+        for offset in range(start, stop, EVENT_SIZE):
+            ev_type, code = TYPE_CODE.unpack_from(buffer, offset + TYPE_OFFSET)
+            if ev_type in BLOCKED_TYPES:
+                continue
+
+            if ev_type == e.EV_SYN:
+                if code == e.SYN_DROPPED:
+                    # The frame in progress is incomplete, throw it away.
+                    keep = frame_end
+                    self.dropped = True
+                    if self.name:
+                        metrics.counters[("dropped", self.name)] += 1
+                    continue
+                if code == e.SYN_REPORT and self.dropped:
+                    keep = frame_end
+                    self.dropped = False
+                    continue
+            if self.dropped:
+                continue
+
+            if keep != offset:
+                buffer[keep:keep + EVENT_SIZE] = buffer[offset:offset + EVENT_SIZE]
+            keep += EVENT_SIZE
+            if ev_type == e.EV_SYN and code == e.SYN_REPORT:
+                frame_end = keep
+        self.used = keep
+        return frame_end
+
+
+# Forwards a grabbed device to ui_device until the device goes away or the service stops.
+# Read errors are raised to the caller.
+async def forward_device(device, ui_device, name):
+    forwarder = Forwarder(device.fd, ui_device.fd, name)
+    await reactor.watch(device.fd, name, lambda fd: forwarder.forward() // EVENT_SIZE)
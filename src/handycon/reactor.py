@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# This file is part of Handheld Game Console Controller System (HandyGCCS)
+# Copyright 2022-2023 Derek J. Clark <derekjohn.clark@gmail.com>
+
+## Python Modules
+import asyncio
+import os
+import select
+
+# Local modules
+from .constants import *
+
+## Partial imports
+from collections import deque
+
+handycon = None
+
+# One epoll for every device fd. Only its own fd is registered with the asyncio loop, so
+# any number of ready devices cost a single wakeup.
+epoll = None
+
+# fd: Watch
+watches = {}
+
+# name: counts of every watch that has ended, plus how many times the name was watched.
+totals = {}
+
+def set_handycon(handheld_controller):
+    global handycon
+    handycon = handheld_controller
+
+
+# A registered fd. callback(fd) is called whenever the fd is readable, must not block and
+# returns the number of events it handled. Exceptions from callback end the watch and are
+# raised in the task waiting on done.
+class Watch:
+    def __init__(self, fd, name, callback, done):
+        self.fd = fd
+        self.name = name
+        self.callback = callback
+        self.done = done
+        self.wakeups = 0
+        self.events = 0
+
+
+def start(loop):
+    global epoll
+
+    epoll = select.epoll()
+    loop.add_reader(epoll.fileno(), dispatch)
+
+
+def stop(loop):
+    global epoll
+
+    if not epoll:
+        return
+    loop.remove_reader(epoll.fileno())
+    for watch in list(watches.values()):
+        unwatch(watch.fd)
+        if not watch.done.done():
+            watch.done.set_result(None)
+    epoll.close()
+    epoll = None
+
+
+# Reads every ready fd in one pass and calls its callback.
+def dispatch():
+    for fd, mask in epoll.poll(0):
+        watch = watches.get(fd)
+        if not watch:
+            continue
+        watch.wakeups += 1
+        try:
+            count = watch.callback(fd)
+            watch.events += count
+            # The device is gone. Stop before epoll reports it forever.
+            if not count and mask & (select.EPOLLERR | select.EPOLLHUP):
+                raise OSError(f"{watch.name} was disconnected.")
+        except Exception as err:
+            unwatch(fd)
+            if not watch.done.done():
+                watch.done.set_exception(err)
+
+
+def unwatch(fd):
+    watch = watches.pop(fd, None)
+    if watch is None:
+        return
+
+    # Keep the counts of a device across reconnects.
+    total = totals[watch.name]
+    total["wakeups"] += watch.wakeups
+    total["events"] += watch.events
+    if not epoll:
+        return
+    try:
+        epoll.unregister(fd)
+    except (OSError, ValueError):
+        # The fd was already closed.
+        pass
+
+
+# Registers fd and returns a future that is resolved when the service stops, or fails
+# with the callback's exception.
+def add(fd, name, callback):
+    done = asyncio.get_running_loop().create_future()
+    watches[fd] = Watch(fd, name, callback, done)
+    totals.setdefault(name, {"watches": 0, "wakeups": 0, "events": 0})["watches"] += 1
+    epoll.register(fd, select.EPOLLIN)
+    return done
+
+
+# Calls callback whenever fd is readable until the callback raises or the service stops.
+# The callback's exception is raised here so the capture task can release the device.
+async def watch(fd, name, callback):
+    try:
+        await add(fd, name, callback)
+    finally:
+        unwatch(fd)
+
+
+# Reads everything an evdev device has queued. Returns an empty list once it is drained.
+def read_events(device):
+    events = []
+    while True:
+        try:
+            count = len(events)
+            events.extend(device.read())
+        except BlockingIOError:
+            return events
+        if len(events) == count:
+            return events
+
+
+# Reads every report a hidraw fd has queued. hidraw returns one report per read.
+def read_reports(fd, size):
+    reports = []
+    while True:
+        try:
+            report = os.read(fd, size)
+        except BlockingIOError:
+            return reports
+        if not report:
+            return reports
+        reports.append(report)
+
+
+# Yields the events of an evdev device in batches, one batch for every time the device
+# became readable. Read errors are raised here.
+def read_batches(device, name):
+    return watch_batches(device.fd, name, lambda: read_events(device))
+
+
+# Yields the reports of a hidraw fd in batches, like read_batches.
+def read_report_batches(fd, name, size):
+    return watch_batches(fd, name, lambda: read_reports(fd, size))
+
+
+# Yields what read() returns every time fd becomes readable and read() finds something.
+async def watch_batches(fd, name, read):
+    batches = deque()
+    ready = asyncio.Event()
+
+    def on_readable(fd):
+        items = read()
+        if items:
+            batches.append(items)
+            ready.set()
+        return len(items)
+
+    done = add(fd, name, on_readable)
+    done.add_done_callback(lambda future: ready.set())
+    try:
+        while handycon.running:
+            await ready.wait()
+            ready.clear()
+            while batches:
+                yield batches.popleft()
+            if done.done():
+                done.result()
+                return
+    finally:
+        unwatch(fd)
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# This file is part of Handheld Game Console Controller System (HandyGCCS)
+# Copyright 2022-2023 Derek J. Clark <derekjohn.clark@gmail.com>
+
+## Python Modules
+import mmap
+import struct
+import time
+import traceback
+
+# Local modules
+from .constants import *
+
+handycon = None
+
+# Log layout, all little endian:
+#   FILE_HEADER
+#   records of RECORD followed by length bytes of payload.
+# A record on the reserved DECLARE stream names a new stream: its payload is STREAM
+# followed by the utf-8 name. Every other record holds what one read returned: struct
+# input_event as the kernel wrote them (kernel timestamps included) for evdev streams, or
+# the raw report for HID streams. The header timestamp is CLOCK_MONOTONIC at the read.
+MAGIC = b"HGCCSREC"
+VERSION = 1
+FILE_HEADER = struct.Struct("<8sHH32s")   # magic, version, reserved, system_type
+RECORD = struct.Struct("<QHH")            # monotonic ns, stream, payload length
+STREAM = struct.Struct("<HB")             # stream, kind
+DECLARE = 0xffff
+
+# Stream kinds, which decide how replay dispatches them.
+KEYBOARD = 0
+GAMEPAD = 1
+POWER = 2
+HID = 3
+
+# struct input_event
+EVENT = struct.Struct("llHHi")
+
+# The active Recorder, or None. Checked inline on the read paths.
+recorder = None
+
+def set_handycon(handheld_controller):
+    global handycon
+    handycon = handheld_controller
+
+
+# Appends every input stream handycon reads to a log for replay.py.
+class Recorder:
+    def __init__(self, path, system_type):
+        self.file = open(path, "wb")
+        self.file.write(FILE_HEADER.pack(MAGIC, VERSION, 0, (system_type or "").encode()))
+        self.streams = {}
+
+    def declare(self, name, kind):
+        stream = len(self.streams)
+        self.streams[name] = stream
+        payload = STREAM.pack(stream, kind) + name.encode()
+        self.file.write(RECORD.pack(time.monotonic_ns(), DECLARE, len(payload)))
+        self.file.write(payload)
+        return stream
+
+    # Writes one read worth of data. payload is bytes or a memoryview.
+    def write(self, name, kind, payload):
+        stream = self.streams.get(name)
+        if stream is None:
+            stream = self.declare(name, kind)
+        self.file.write(RECORD.pack(time.monotonic_ns(), stream, len(payload)))
+        self.file.write(payload)
+
+    # Packs a batch of InputEvents back into struct input_event.
+    def write_events(self, name, kind, events):
+        self.write(name, kind, b"".join([EVENT.pack(event.sec, event.usec, event.type, event.code, event.value) for event in events]))
+
+    def close(self):
+        self.file.close()
+
+
+# Starts recording to path. Failing to open the log doesn't stop the service.
+def start(path, system_type):
+    global recorder
+
+    try:
+        recorder = Recorder(path, system_type)
+    except OSError as err:
+        handycon.logger.error(f"{err} | Unable to open recording {path}.")
+        handycon.logger.error(traceback.format_exc())
+        return
+    handycon.logger.info(f"Recording input to {path}.")
+
+
+def stop():
+    global recorder
+
+    if recorder:
+        recorder.close()
+        recorder = None
+
+
+# Memory maps a log. Returns the system type it was recorded on and a generator of
+# (timestamp_ns, name, kind, payload) for every record. Payloads are views into the map.
+def read_log(path):
+    with open(path, "rb") as log_file:
+        data = mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(data)
+    magic, version, reserved, system_type = FILE_HEADER.unpack_from(view)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path} is not a version {VERSION} HandyGCCS recording.")
+    return system_type.rstrip(b"\0").decode(), records(view, FILE_HEADER.size)
+
+
+def records(view, offset):
+    streams = {}
+    while offset + RECORD.size <= len(view):
+        timestamp, stream, length = RECORD.unpack_from(view, offset)
+        offset += RECORD.size
+        payload = view[offset:offset + length]
+        offset += length
+        if len(payload) < length:
+            # The recording was cut off mid write.
+            return
+        if stream == DECLARE:
+            stream, kind = STREAM.unpack_from(payload)
+            streams[stream] = (bytes(payload[STREAM.size:]).decode(), kind)
+            continue
+        name, kind = streams[stream]
+        yield timestamp, name, kind, payload
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+# This file is part of Handheld Game Console Controller System (HandyGCCS)
+# Copyright 2022-2023 Derek J. Clark <derekjohn.clark@gmail.com>
+
+## Python Modules
+import configparser
+import fnmatch
+import os
+
+# Local modules
+from .constants import *
+
+## Partial imports
+from collections import namedtuple
+
+handycon = None
+
+# A handheld profile. constraints is a tuple of (dmi key, value) pairs that must also match
+# and source is the drop-in file it came from, or None for built-in profiles.
+Profile = namedtuple("Profile", ["system_type", "constraints", "source"])
+
+# system_type: driver module in handycon.handhelds
+HANDHELD_DRIVERS = {
+        "ALY_GEN1": "ally_gen1",
+        "ANB_GEN1": "anb_gen1",
+        "AOK_GEN1": "aok_gen1",
+        "AOK_GEN2": "aok_gen2",
+        "AYA_GEN1": "aya_gen1",
+        "AYA_GEN2": "aya_gen2",
+        "AYA_GEN3": "aya_gen3",
+        "AYA_GEN4": "aya_gen4",
+        "AYA_GEN5": "aya_gen5",
+        "AYA_GEN6": "aya_gen6",
+        "AYA_GEN7": "aya_gen7",
+        "AYN_GEN1": "ayn_gen1",
+        "AYN_GEN2": "ayn_gen2",
+        "AYN_GEN3": "ayn_gen3",
+        "GO_GEN1": "go_gen1",
+        "GPD_GEN1": "gpd_gen1",
+        "GPD_GEN2": "gpd_gen2",
+        "GPD_GEN3": "gpd_gen3",
+        "OXP_GEN1": "oxp_gen1",
+        "OXP_GEN2": "oxp_gen2",
+        "OXP_GEN3": "oxp_gen3",
+        "OXP_GEN4": "oxp_gen4",
+        "OXP_GEN5": "oxp_gen5",
+        "OXP_GEN6": "oxp_gen6",
+        "OXP_GEN7": "oxp_gen7",
+    }
+
+# (product_name, system_type, {dmi key: value}). Entries with constraints are tried first.
+BUILTIN_PROFILES = [
+        ## ANBERNIC Devices
+        ("Win600", "ANB_GEN1", {}),
+
+        ## AOKZOE Devices
+        ("AOKZOE A1 AR07", "AOK_GEN1", {}),
+        ("AOKZOE A1 Pro", "AOK_GEN2", {}),
+
+        ## ASUS Devices
+        ("ROG Ally RC71L_RC71L", "ALY_GEN1", {}),
+
+        ## Aya Neo Devices
+        ("AYA NEO FOUNDER", "AYA_GEN1", {}),
+        ("AYA NEO 2021", "AYA_GEN1", {}),
+        ("AYANEO 2021", "AYA_GEN1", {}),
+        ("AYANEO 2021 Pro", "AYA_GEN1", {}),
+        ("AYANEO 2021 Pro Retro Power", "AYA_GEN1", {}),
+        ("NEXT", "AYA_GEN2", {}),
+        ("NEXT Pro", "AYA_GEN2", {}),
+        ("NEXT Advance", "AYA_GEN2", {}),
+        ("AYANEO NEXT", "AYA_GEN2", {}),
+        ("AYANEO NEXT Pro", "AYA_GEN2", {}),
+        ("AYANEO NEXT Advance", "AYA_GEN2", {}),
+        ("AIR", "AYA_GEN3", {}),
+        ("AIR Pro", "AYA_GEN3", {}),
+        ("AYANEO 2", "AYA_GEN4", {}),
+        ("GEEK", "AYA_GEN4", {}),
+        ("AIR Plus", "AYA_GEN7", {"cpu_vendor": "GenuineIntel"}),
+        ("AIR Plus", "AYA_GEN5", {}),
+        ("AYANEO 2S", "AYA_GEN6", {}),
+        ("GEEK 1S", "AYA_GEN6", {}),
+        ("AIR 1S", "AYA_GEN6", {}),
+
+        ## Ayn Devices
+        ("Loki Max", "AYN_GEN1", {}),
+        ("Loki Zero", "AYN_GEN2", {}),
+        ("Loki MiniPro", "AYN_GEN3", {}),
+
+        ## Lenovo Devices
+        ("83E1", "GO_GEN1", {}), # Legion Go
+
+        ## GPD Devices
+        # Have 2 buttons with 3 modes (left, right, both)
+        ("G1618-03", "GPD_GEN1", {}), # Win3
+        ("G1619-04", "GPD_GEN2", {}), # WinMax2
+        ("G1618-04", "GPD_GEN3", {}), # Win4
+
+        ## ONEXPLAYER Devices
+        # Older BIOS have incomlete DMI data and most models report as "ONE XPLAYER" or "ONEXPLAYER".
+        ("ONE XPLAYER", "OXP_GEN1", {"cpu_vendor": "GenuineIntel"}),
+        ("ONE XPLAYER", "OXP_GEN2", {}),
+        ("ONEXPLAYER", "OXP_GEN1", {"cpu_vendor": "GenuineIntel"}),
+        ("ONEXPLAYER", "OXP_GEN2", {}),
+        ("ONEXPLAYER mini A07", "OXP_GEN3", {}),
+        ("ONEXPLAYER Mini Pro", "OXP_GEN4", {}),
+        ("ONEXPLAYER 2 ARP23", "OXP_GEN5", {}),
+        ("ONEXPLAYER 2 PRO ARP23P", "OXP_GEN6", {}),
+        ("ONEXPLAYER 2 PRO ARP23P EVA-01", "OXP_GEN6", {}),
+        ("ONEXPLAYER F1", "OXP_GEN7", {}),
+    ]
+DMI_KEYS = ("product_name", "sys_vendor", "board_name")
+GLOB_CHARS = "*?["
+
+# product_name: [Profile, ...]
+profiles = {}
+
+# [(pattern, Profile), ...] tried in order when there is no exact product_name match.
+glob_profiles = []
+
+def set_handycon(handheld_controller):
+    global handycon
+    handycon = handheld_controller
+
+
+def add_profile(product_name, system_type, constraints, source=None):
+    profile = Profile(system_type, tuple(constraints.items()), source)
+    if any(char in product_name for char in GLOB_CHARS):
+        glob_profiles.append((product_name, profile))
+        return
+
+    # Drop-ins win over built-ins, then the most specific profile wins.
+    candidates = profiles.setdefault(product_name, [])
+    candidates.append(profile)
+    candidates.sort(key=lambda candidate: (candidate.source is None, -len(candidate.constraints)))
+
+
+# Builds the lookup tables. Drop-in files are loaded first so they take priority over
+# the built-in profiles.
+def load(profile_dir=DEVICE_PROFILE_DIR):
+    profiles.clear()
+    glob_profiles.clear()
+    load_drop_ins(profile_dir)
+    for product_name, system_type, constraints in BUILTIN_PROFILES:
+        add_profile(product_name, system_type, constraints)
+
+
+# Drop-in files are ini files in profile_dir. Each section is a product_name, or a glob
+# pattern, with a system_type and optional sys_vendor, board_name and cpu_vendor keys.
+#
+# [AYANEO 2S]
+# system_type = AYA_GEN6
+def load_drop_ins(profile_dir):
+    if not os.path.isdir(profile_dir):
+        return
+
+    for file_name in sorted(os.listdir(profile_dir)):
+        if not file_name.endswith(".conf"):
+            continue
+        path = os.path.join(profile_dir, file_name)
+        drop_in = configparser.ConfigParser(interpolation=None)
+        # Keep the case of the DMI keys and values.
+        drop_in.optionxform = str
+        try:
+            drop_in.read(path)
+        except configparser.Error as err:
+            handycon.logger.error(f"{err} | Unable to parse {path}.")
+            continue
+
+        for product_name in drop_in.sections():
+            section = dict(drop_in[product_name])
+            system_type = section.pop("system_type", None)
+            if system_type not in HANDHELD_DRIVERS:
+                handycon.logger.warn(f"{path}: {product_name} has unknown system_type {system_type}. Skipping.")
+                continue
+            handycon.logger.debug(f"Loaded {product_name} as {system_type} from {path}")
+            add_profile(product_name, system_type, section, path)
+
+
+def read_dmi():
+    dmi = {}
+    for key in DMI_KEYS:
+        try:
+            with open(DMI_PATH / key, "r") as dmi_file:
+                dmi[key] = dmi_file.read().strip()
+        except OSError:
+            dmi[key] = ""
+    return dmi
+
+
+# Returns the Profile for the given DMI data, or None if the system isn't supported.
+def lookup(dmi):
+    if not profiles:
+        load()
+
+    for profile in profiles.get(dmi["product_name"], ()):
+        if matches(profile, dmi):
+            return profile
+
+    for pattern, profile in glob_profiles:
+        if fnmatch.fnmatchcase(dmi["product_name"], pattern) and matches(profile, dmi):
+            return profile
+    return None
+
+
+def matches(profile, dmi):
+    for key, value in profile.constraints:
+        if dmi.get(key) != value:
+            return False
+    return True
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+# This file is part of Handheld Game Console Controller System (HandyGCCS)
+# Copyright 2022-2023 Derek J. Clark <derekjohn.clark@gmail.com>
+#
+# Replays a log written with HANDYGCCS_RECORD through the same frame assembly, chord
+# dispatch, process_event and emit code the service runs, with a memfd standing in for the
+# uinput device. Needs no hardware and no root, so any handheld profile can be run on a
+# plain Linux box.
+#
+# Usage: handycon-replay LOG [--system-type GO_GEN1] [--config FILE] [--realtime] [--dump]
+
+## Python Modules
+import argparse
+import asyncio
+import configparser
+import hashlib
+import importlib
+import json
+import os
+import struct
+import time
+
+# Local modules
+from .constants import *
+from . import actions
+from . import backend
+from . import chords
+from . import devices
+from . import frames
+from . import keystate
+from . import latency
+from . import metrics
+from . import passthrough
+from . import recording
+from . import registry
+from . import scheduler
+from . import utilities
+
+## Partial imports
+from collections import Counter
+from evdev import InputEvent
+from .handycon import HandheldController
+
+TIME = struct.Struct("ll")
+
+
+# Stands in for the uinput device. Everything written to it is kept in a memfd.
+class Sink:
+    def __init__(self):
+        self.name = "HandyGCCS Replay"
+        self.fd = os.memfd_create("handygccs-replay")
+
+    def write(self, ev_type, code, value):
+        os.write(self.fd, recording.EVENT.pack(0, 0, ev_type, code, value))
+
+    def write_event(self, event):
+        self.write(event.type, event.code, event.value)
+
+    def syn(self):
+        os.write(self.fd, actions.SYN_REPORT)
+
+    # Returns (type, code, value) of every event written, timestamps left out so runs
+    # compare equal.
+    def events(self):
+        data = os.pread(self.fd, os.fstat(self.fd).st_size, 0)
+        return [event[2:] for event in recording.EVENT.iter_unpack(data)]
+
+
+# Stands in for an evdev device. read() returns the batch being replayed once.
+class ReplayDevice:
+    def __init__(self, name):
+        self.name = name
+        self.batch = []
+        self.keys = set()
+
+    def feed(self, events):
+        self.batch = events
+        for event in events:
+            if event.type == e.EV_KEY and event.value == 1:
+                self.keys.add(event.code)
+            elif event.type == e.EV_KEY and event.value == 0:
+                self.keys.discard(event.code)
+
+    def read(self):
+        if not self.batch:
+            raise BlockingIOError
+        batch, self.batch = self.batch, []
+        return batch
+
+    def active_keys(self):
+        return sorted(self.keys)
+
+
+# A keyboard stream. Batches go through frames.read_frames and devices.dispatch_frames in a
+# task of their own, like the capture loop, and feed() returns once a batch is handled.
+class Keyboard:
+    def __init__(self, name, codes):
+        self.device = ReplayDevice(name)
+        self.queue = asyncio.Queue()
+        self.drained = None
+        key_state = keystate.KeyState(self.device, codes)
+        source = frames.read_frames(self.device, key_state, name, self.batches())
+        self.task = asyncio.ensure_future(devices.dispatch_frames(source, name))
+        self.task.add_done_callback(self.stopped)
+
+    async def batches(self):
+        while True:
+            batch = await self.queue.get()
+            if batch is None:
+                return
+            yield batch
+            self.drained.set_result(None)
+
+    def stopped(self, task):
+        if self.drained and not self.drained.done():
+            if task.cancelled():
+                self.drained.cancel()
+            else:
+                self.drained.set_exception(task.exception() or EOFError(f"{self.device.name} stopped."))
+
+    async def feed(self, events):
+        self.device.feed(events)
+        self.drained = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait(events)
+        await self.drained
+
+    async def close(self):
+        self.queue.put_nowait(None)
+        await self.task
+
+
+# A gamepad stream, forwarded by passthrough.Forwarder through a pipe.
+class Gamepad:
+    def __init__(self, name, sink):
+        self.read_fd, self.write_fd = os.pipe()
+        os.set_blocking(self.read_fd, False)
+        self.forwarder = passthrough.Forwarder(self.read_fd, sink.fd, name)
+
+    def feed(self, payload):
+        os.write(self.write_fd, payload)
+        self.forwarder.forward()
+
+    def close(self):
+        os.close(self.read_fd)
+        os.close(self.write_fd)
+
+
+# The service without its devices. Power and performance commands are skipped, and Steam
+# and Chimera are never launched.
+class ReplayController(HandheldController):
+    dry_run = True
+
+    def __init__(self, system_type, config_path=None):
+        self.running = True
+        for module in (backend, chords, devices, keystate, latency, metrics, recording, registry, scheduler, utilities):
+            module.set_handycon(self)
+        # No devices at all, so drivers that look for theirs find nothing.
+        backend.current = backend.FakeBackend({})
+        self.event_queue = actions.Pending()
+        self.hid_event_queue = actions.Pending()
+
+        self.system_type = system_type
+        self.handheld = importlib.import_module(f"handycon.handhelds.{registry.HANDHELD_DRIVERS[system_type]}")
+        # Some drivers look for their devices and exit if they aren't there. Replay has
+        # none, so only the defaults they set before that are kept.
+        try:
+            self.handheld.init_handheld(self)
+        except SystemExit:
+            self.logger.debug(f"{system_type} didn't find its devices. Replaying without them.")
+
+        self.config = configparser.ConfigParser()
+        if config_path:
+            self.config.read(config_path)
+        else:
+            utilities.set_default_config()
+        utilities.map_config()
+        self.ui_device = Sink()
+
+    def steam_ifrunning_deckui(self, cmd):
+        self.logger.debug(f"Replay: would run {cmd}.")
+        return True
+
+    def launch_chimera(self):
+        self.logger.debug("Replay: would launch Chimera.")
+
+
+# Copies a payload of struct input_event with every timestamp set to now, so latency
+# measures the replay and not the age of the recording.
+def restamp(payload):
+    data = bytearray(payload)
+    sec, usec = divmod(time.clock_gettime_ns(time.CLOCK_MONOTONIC) // 1000, 1000000)
+    for offset in range(0, len(data), recording.EVENT.size):
+        TIME.pack_into(data, offset, sec, usec)
+    return data
+
+
+def to_events(data):
+    return [InputEvent(*event) for event in recording.EVENT.iter_unpack(data)]
+
+
+# Feeds every record to the code that would have read it. Returns records per stream.
+async def replay(controller, records, realtime=False):
+    loop = asyncio.get_running_loop()
+    emitter = asyncio.ensure_future(scheduler.run())
+    keyboards = {}
+    gamepads = {}
+    power_devices = {}
+    counts = Counter()
+    start = loop.time()
+    first = None
+
+    for timestamp, name, kind, payload in records:
+        if realtime:
+            first = first or timestamp
+            delay = (timestamp - first) / 1000000000 - (loop.time() - start)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        counts[name] += 1
+
+        match kind:
+            case recording.KEYBOARD:
+                if name not in keyboards:
+                    keyboards[name] = Keyboard(name, controller.handheld.CHORDS.codes)
+                await keyboards[name].feed(to_events(restamp(payload)))
+            case recording.GAMEPAD:
+                if name not in gamepads:
+                    gamepads[name] = Gamepad(name, controller.ui_device)
+                gamepads[name].feed(restamp(payload))
+            case recording.POWER:
+                device = power_devices.setdefault(name, ReplayDevice(name))
+                device.feed(to_events(restamp(payload)))
+                devices.handle_power_events(device, name)
+            case recording.HID:
+                await controller.handheld.process_event(None, None, bytes(payload))
+
+    # Let the scheduler write out the last action.
+    while scheduler.pending:
+        await asyncio.sleep(controller.BUTTON_DELAY or 0.001)
+    for keyboard in keyboards.values():
+        await keyboard.close()
+    for gamepad in gamepads.values():
+        gamepad.close()
+    controller.running = False
+    emitter.cancel()
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a HandyGCCS input recording without hardware.")
+    parser.add_argument("log", help="recording made with HANDYGCCS_RECORD")
+    parser.add_argument("--system-type", help="driver to replay with, default the one it was recorded on")
+    parser.add_argument("--config", help="config file to map buttons from, default the default config")
+    parser.add_argument("--realtime", action="store_true", help="keep the recorded timing instead of replaying as fast as possible")
+    parser.add_argument("--dump", action="store_true", help="print every output event")
+    args = parser.parse_args()
+
+    system_type, records = recording.read_log(args.log)
+    controller = ReplayController(args.system_type or system_type, args.config)
+
+    started = time.perf_counter()
+    counts = asyncio.run(replay(controller, records, args.realtime))
+    elapsed = time.perf_counter() - started
+
+    output = controller.ui_device.events()
+    if args.dump:
+        for ev_type, code, value in output:
+            print(ev_type, code, value)
+    digest = hashlib.sha256(b"".join(struct.pack("HHi", *event) for event in output))
+    print(json.dumps({
+        "system_type": controller.system_type,
+        "records": counts,
+        "elapsed_s": round(elapsed, 6),
+        "output_events": len(output),
+        "output_digest": digest.hexdigest(),
+        "devices": metrics.device_stats(),
+        "latency": latency.snapshot(),
+        }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# This file is part of Handheld Game Console Controller System (HandyGCCS)
+# Copyright 2022-2023 Derek J. Clark <derekjohn.clark@gmail.com>
+
+## Python Modules
+import asyncio
+import heapq
+import itertools
+import traceback
+
+# Local modules
+from .constants import *
+from . import latency
+
+handycon = None
+
+# Timed output frames as (due, sequence, frame, trace). sequence keeps frames that are due
+# at the same time in the order they were scheduled. trace is (name, sec, usec) of the
+# input that triggered the action, set on its last frame only.
+pending = []
+sequence = itertools.count()
+
+# Loop time the last scheduled frame goes out. Later sequences start after it so the
+# frames of two actions are never interleaved.
+busy_until = 0.0
+
+# Set when a frame is added so the emitter can recalculate its sleep.
+wakeup = None
+
+def set_handycon(handheld_controller):
+    global handycon
+    handycon = handheld_controller
+
+
+# Queues packed SYN_REPORT frames to be written delay seconds apart and returns
+# immediately. If nothing is pending the first frame is written right away. If trace is
+# given the action latency is recorded once the last frame is out.
+def schedule(frames, delay, trace=None):
+    global busy_until
+
+    if not frames:
+        return
+    loop = asyncio.get_running_loop()
+    now = loop.time()
+    due = max(now, busy_until)
+    if due <= now and not pending:
+        first, frames = frames[0], frames[1:]
+        due = now + delay
+        # Same handling as run(), a failed write mustn't reach the capture loop that called us.
+        try:
+            handycon.write_frame(first)
+            if trace and not frames:
+                latency.record("action", *trace)
+        except Exception as err:
+            handycon.logger.error(f"{err} | Error writing scheduled frame.")
+            handycon.logger.error(traceback.format_exc())
+    for index, frame in enumerate(frames, 1):
+        heapq.heappush(pending, (due, next(sequence), frame, trace if index == len(frames) else None))
+        due += delay
+    busy_until = due - delay if frames else now
+    if frames and wakeup:
+        wakeup.set()
+
+
+# Writes scheduled frames as they come due. Runs for the life of the service.
+async def run():
+    global wakeup
+
+    wakeup = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    while handycon.running:
+        if not pending:
+            await wakeup.wait()
+            wakeup.clear()
+            continue
+
+        due = pending[0][0]
+        wait = due - loop.time()
+        if wait > 0:
+            try:
+                await asyncio.wait_for(wakeup.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+            wakeup.clear()
+            continue
+
+        due, order, frame, trace = heapq.heappop(pending)
+        try:
+            handycon.write_frame(frame)
+            if trace:
+                latency.record("action", *trace)
+        except Exception as err:
+            handycon.logger.error(f"{err} | Error writing scheduled frame.")
+            handycon.logger.error(traceback.format_exc())
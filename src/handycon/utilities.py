@@ -5,6 +5,7 @@
 # Python Modules
 import asyncio
 import configparser
+import importlib
 import os
 import re
 import subprocess
@@ -12,37 +13,16 @@ import sys
 import traceback
 
 ## Local modules
-import handycon.handhelds.ally_gen1 as ally_gen1
-import handycon.handhelds.anb_gen1 as anb_gen1
-import handycon.handhelds.aok_gen1 as aok_gen1
-import handycon.handhelds.aok_gen2 as aok_gen2
-import handycon.handhelds.aya_gen1 as aya_gen1
-import handycon.handhelds.aya_gen2 as aya_gen2
-import handycon.handhelds.aya_gen3 as aya_gen3
-import handycon.handhelds.aya_gen4 as aya_gen4
-import handycon.handhelds.aya_gen5 as aya_gen5
-import handycon.handhelds.aya_gen6 as aya_gen6
-import handycon.handhelds.aya_gen7 as aya_gen7
-import handycon.handhelds.ayn_gen1 as ayn_gen1
-import handycon.handhelds.ayn_gen2 as ayn_gen2
-import handycon.handhelds.ayn_gen3 as ayn_gen3
-import handycon.handhelds.go_gen1 as go_gen1
-import handycon.handhelds.gpd_gen1 as gpd_gen1
-import handycon.handhelds.gpd_gen2 as gpd_gen2
-import handycon.handhelds.gpd_gen3 as gpd_gen3
-import handycon.handhelds.oxp_gen1 as oxp_gen1
-import handycon.handhelds.oxp_gen2 as oxp_gen2
-import handycon.handhelds.oxp_gen3 as oxp_gen3
-import handycon.handhelds.oxp_gen4 as oxp_gen4
-import handycon.handhelds.oxp_gen5 as oxp_gen5
-import handycon.handhelds.oxp_gen6 as oxp_gen6
-import handycon.handhelds.oxp_gen7 as oxp_gen7
 from .constants import *
+from . import actions
+from . import backend
+from . import registry
 
 ## Partial imports
 from time import sleep
 
 handycon = None
+
 def set_handycon(handheld_controller):
     global handycon
     handycon = handheld_controller
@@ -72,200 +52,28 @@ def get_user():
 def id_system():
     global handycon
 
-    system_id = open("/sys/devices/virtual/dmi/id/product_name", "r").read().strip()
+    dmi = backend.current.read_dmi()
+    system_id = dmi["product_name"]
     handycon.logger.debug(f"Found System ID: {system_id}")
 
-    cpu_vendor = get_cpu_vendor()
-    handycon.logger.debug(f"Found CPU Vendor: {cpu_vendor}")
-
-    ## ANBERNIC Devices
-    if system_id in (
-            "Win600",
-            ):
-        handycon.system_type = "ANB_GEN1"
-        anb_gen1.init_handheld(handycon)
-
-    ## AOKZOE Devices
-    elif system_id in (
-        "AOKZOE A1 AR07",
-        ):
-        handycon.system_type = "AOK_GEN1"
-        aok_gen1.init_handheld(handycon)
-
-    elif system_id in (
-        "AOKZOE A1 Pro",
-        ):
-        handycon.system_type = "AOK_GEN2"
-        aok_gen2.init_handheld(handycon)
-
-
-    ## ASUS Devices
-    elif system_id in (
-        "ROG Ally RC71L_RC71L",
-        ):
-        handycon.system_type = "ALY_GEN1"
-        ally_gen1.init_handheld(handycon)
-
-    ## Aya Neo Devices
-    elif system_id in (
-        "AYA NEO FOUNDER",
-        "AYA NEO 2021",
-        "AYANEO 2021",
-        "AYANEO 2021 Pro",
-        "AYANEO 2021 Pro Retro Power",
-        ):
-        handycon.system_type = "AYA_GEN1"
-        aya_gen1.init_handheld(handycon)
-
-    elif system_id in (
-        "NEXT",
-        "NEXT Pro",
-        "NEXT Advance",
-        "AYANEO NEXT",
-        "AYANEO NEXT Pro",
-        "AYANEO NEXT Advance",
-        ):
-        handycon.system_type = "AYA_GEN2"
-        aya_gen2.init_handheld(handycon)
-
-    elif system_id in (
-        "AIR",
-        "AIR Pro",
-        ):
-        handycon.system_type = "AYA_GEN3"
-        aya_gen3.init_handheld(handycon)
-
-    elif system_id in (
-        "AYANEO 2",
-        "GEEK",
-        ):
-        handycon.system_type = "AYA_GEN4"
-        aya_gen4.init_handheld(handycon)
-
-    elif system_id in (
-        "AIR Plus",
-        ):
-        if cpu_vendor == "GenuineIntel":
-            handycon.system_type = "AYA_GEN7"
-            aya_gen7.init_handheld(handycon)
-        else:
-            handycon.system_type = "AYA_GEN5"
-            aya_gen5.init_handheld(handycon)
-
-    elif system_id in (
-        "AYANEO 2S",
-        "GEEK 1S",
-        "AIR 1S",
-        ):
-        handycon.system_type = "AYA_GEN6"
-        aya_gen6.init_handheld(handycon)
-
-    ## Ayn Devices
-    elif system_id in (
-            "Loki Max",
-        ):
-        handycon.system_type = "AYN_GEN1"
-        ayn_gen1.init_handheld(handycon)
-
-    elif system_id in (
-            "Loki Zero",
-        ):
-        handycon.system_type = "AYN_GEN2"
-        ayn_gen2.init_handheld(handycon)
-
-    elif system_id in (
-            "Loki MiniPro",
-        ):
-        handycon.system_type = "AYN_GEN3"
-        ayn_gen3.init_handheld(handycon)
-
-    ## Lenovo Devices
-    elif system_id in (
-            "83E1", #Legion Go
-        ):
-        handycon.system_type = "GO_GEN1"
-        go_gen1.init_handheld(handycon)
-
-    ## GPD Devices
-    # Have 2 buttons with 3 modes (left, right, both)
-    elif system_id in (
-        "G1618-03", #Win3
-        ):
-        handycon.system_type = "GPD_GEN1"
-        gpd_gen1.init_handheld(handycon)
-
-    elif system_id in (
-        "G1619-04", #WinMax2
-        ):
-        handycon.system_type = "GPD_GEN2"
-        gpd_gen2.init_handheld(handycon)
-
-    elif system_id in (
-        "G1618-04", #Win4
-        ):
-        handycon.system_type = "GPD_GEN3"
-        gpd_gen3.init_handheld(handycon)
-
-    ## ONEXPLAYER Devices
-    # Older BIOS have incomlete DMI data and most models report as "ONE XPLAYER" or "ONEXPLAYER".
-    elif system_id in (
-        "ONE XPLAYER",
-        "ONEXPLAYER",
-        ):
-
-        # GEN 1
-        if cpu_vendor == "GenuineIntel":
-            handycon.system_type = "OXP_GEN1"
-            oxp_gen1.init_handheld(handycon)
-        
-        # GEN 2
-        else:
-            handycon.system_type = "OXP_GEN2"
-            oxp_gen2.init_handheld(handycon)
-
-    # GEN 3
-    elif system_id in (
-        "ONEXPLAYER mini A07",
-        ):
-        handycon.system_type = "OXP_GEN3"
-        oxp_gen3.init_handheld(handycon)
-
-    # GEN 4
-    elif system_id in (
-        "ONEXPLAYER Mini Pro",
-        ):
-        handycon.system_type = "OXP_GEN4"
-        oxp_gen4.init_handheld(handycon)
-
-    # GEN 5
-    elif system_id in (
-        "ONEXPLAYER 2 ARP23",
-        ):
-        handycon.system_type = "OXP_GEN5"
-        oxp_gen5.init_handheld(handycon)
-
-    # GEN 6
-    elif system_id in (
-        "ONEXPLAYER 2 PRO ARP23P",
-        "ONEXPLAYER 2 PRO ARP23P EVA-01",
-        ):
-        handycon.system_type = "OXP_GEN6"
-        oxp_gen6.init_handheld(handycon)
-
-    # GEN 7
-    elif system_id in (
-        "ONEXPLAYER F1",
-        ):
-        handycon.system_type = "OXP_GEN7"
-        oxp_gen7.init_handheld(handycon)
+    dmi["cpu_vendor"] = get_cpu_vendor()
+    handycon.logger.debug(f"Found CPU Vendor: {dmi['cpu_vendor']}")
+
+    registry.load()
+    profile = registry.lookup(dmi)
 
     # Devices that aren't supported could cause issues, exit.
-    else:
+    if not profile:
         handycon.logger.error(f"{system_id} is not currently supported by this tool. Open an issue on \
 ub at https://github.ShadowBlip/HandyGCCS if this is a bug. If possible, \
 se run the capture-system.py utility found on the GitHub repository and upload \
 the file with your issue.")
         sys.exit(0)
+
+    # Only the driver for this system is ever imported.
+    handycon.system_type = profile.system_type
+    handycon.handheld = importlib.import_module(f"handycon.handhelds.{registry.HANDHELD_DRIVERS[profile.system_type]}")
+    handycon.handheld.init_handheld(handycon)
     handycon.logger.info(f"Identified host system as {system_id} and configured defaults for {handycon.system_type}.")
 
 
@@ -315,6 +123,9 @@ def map_config():
     }
     handycon.power_action = POWER_ACTION_MAP[handycon.config["Button Map"]["power_button"]][0]
 
+    # Compile the press and release frames of every mapped action.
+    actions.compile_actions(handycon.button_map)
+
 
 # Sets the default configuration.
 def set_default_config():
@@ -340,12 +151,16 @@ def set_default_config():
 def write_config():
     global handycon
     # Make the HandyGCCS directory if it doesn't exist.
-    if not os.path.exists(CONFIG_DIR):
-        os.mkdir(CONFIG_DIR)
-
-    with open(CONFIG_PATH, 'w') as config_file:
-        handycon.config.write(config_file)
-        handycon.logger.info(f"Created new config: {CONFIG_PATH}")
+    try:
+        if not os.path.exists(CONFIG_DIR):
+            os.mkdir(CONFIG_DIR)
+
+        with open(CONFIG_PATH, 'w') as config_file:
+            handycon.config.write(config_file)
+            handycon.logger.info(f"Created new config: {CONFIG_PATH}")
+    except OSError as err:
+        # Running unprivileged, e.g. on fake devices. Keep the config in memory.
+        handycon.logger.warn(f"{err} | Unable to write config {CONFIG_PATH}. Using it without saving.")
 
 
 def steam_ifrunning_deckui(cmd):